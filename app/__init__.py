@@ -4,6 +4,7 @@ from flask_dance.contrib.google import make_google_blueprint
 import os
 from dotenv import load_dotenv
 import time
+import threading
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Load environment variables from .env
@@ -61,6 +62,16 @@ def create_app():
     app.register_blueprint(student_bp, url_prefix="/student")
     app.register_blueprint(admin_bp, url_prefix="/admin")
 
+    # Build the precompiled headers for common preludes without delaying startup
+    from app.pch import precompiled_headers
+    from app.execution import COMPILE_FLAGS
+    threading.Thread(target=precompiled_headers.build, args=(COMPILE_FLAGS,), daemon=True).start()
+
+    # Models are loaded on first prediction unless preloaded (shared by workers with gunicorn --preload)
+    from app.ml_models import ml_model_store, PRELOAD
+    if PRELOAD:
+        ml_model_store.get()
+
     # Apply ProxyFix for Railway deployment
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1, x_prefix=1)
 
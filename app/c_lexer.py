@@ -0,0 +1,201 @@
+"""Single-pass C lexer and the shared analysis context for static grading.
+
+The grading heuristics are substring checks ("for " means a loop, "if ("
+a condition). Run on raw source they also match inside string literals
+and comments, e.g. printf("for each item") counts as a loop. The lexer
+splits a submission into comments, string/char literals, preprocessor
+directives, identifiers, numbers and punctuation, and builds a masked
+copy of the source in which comment and literal contents are blanked.
+The copy keeps every line and column, so layout metrics read the same
+on either copy.
+
+analysis_context(code) lexes a submission once and memoizes the views
+and counts every heuristic asks for.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache, cached_property
+
+
+Token = namedtuple('Token', ['kind', 'text', 'line'])
+
+COMMENT = 'comment'
+STRING = 'string'
+CHAR = 'char'
+PREPROCESSOR = 'preprocessor'
+IDENTIFIER = 'identifier'
+KEYWORD = 'keyword'
+NUMBER = 'number'
+PUNCT = 'punct'
+WHITESPACE = 'whitespace'
+
+C_KEYWORDS = frozenset({
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do',
+    'double', 'else', 'enum', 'extern', 'float', 'for', 'goto', 'if', 'inline',
+    'int', 'long', 'register', 'restrict', 'return', 'short', 'signed', 'sizeof',
+    'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void',
+    'volatile', 'while', '_Bool'
+})
+
+# Type keywords the heuristics treat as marking a variable declaration line
+DECLARATION_MARKERS = ('int ', 'char ', 'float ', 'double ')
+
+# Token patterns, in the order the lexer tries them
+_COMMENT = r"//[^\n]*|/\*.*?(?:\*/|\Z)"
+_PREPROCESSOR = r"^[ \t]*\#(?:\\\n|[^\n/]|/(?![/*]))*"
+_STRING = r'"(?:\\.|[^"\\\n])*(?:"|$)'
+_CHAR = r"'(?:\\.|[^'\\\n])*(?:'|$)"
+_NUMBER = r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[A-Za-z]*"
+_IDENTIFIER = r"[A-Za-z_]\w*"
+_WHITESPACE = r"\s+"
+_PUNCT = r"->|\+\+|--|<<=|>>=|<=|>=|==|!=|&&|\|\||<<|>>|[-+*/%&|^!=<>]=|\.\.\.|."
+
+_TOKEN_RE = re.compile(
+    rf"(?P<comment>{_COMMENT})|(?P<preprocessor>{_PREPROCESSOR})|(?P<string>{_STRING})|(?P<char>{_CHAR})"
+    rf"|(?P<number>{_NUMBER})|(?P<identifier>{_IDENTIFIER})|(?P<whitespace>{_WHITESPACE})|(?P<punct>{_PUNCT})",
+    re.DOTALL | re.MULTILINE
+)
+
+# The same token boundaries, but a run of tokens that masking leaves alone
+# (numbers, identifiers, whitespace, punctuation) is one match
+_MASK_RE = re.compile(
+    rf"(?P<comment>{_COMMENT})|(?P<preprocessor>{_PREPROCESSOR})|(?P<string>{_STRING})|(?P<char>{_CHAR})"
+    rf"|(?P<plain>(?:(?!{_COMMENT}|{_PREPROCESSOR}|{_STRING}|{_CHAR})(?:{_NUMBER}|{_IDENTIFIER}|{_WHITESPACE}|{_PUNCT}))+)",
+    re.DOTALL | re.MULTILINE
+)
+
+
+def _blank(text):
+    """Spaces in place of every character except newlines."""
+    return re.sub(r'[^\n]', ' ', text)
+
+
+def _mask_literal(text):
+    """A string/char literal with its contents blanked and its quotes kept."""
+    quote = text[0]
+    inner = text[1:-1]
+    # Closed unless the final quote is itself escaped (odd run of backslashes)
+    closed = (len(text) > 1 and text.endswith(quote) and
+              (len(inner) - len(inner.rstrip('\\'))) % 2 == 0)
+    if not closed:
+        inner = text[1:]
+    return quote + _blank(inner) + (quote if closed else '')
+
+
+def tokenize(code):
+    """Lex `code` in one pass. Returns (tokens, masked source).
+
+    Tokens cover the whole source, whitespace excluded. In the masked
+    source comments are blanked entirely and string/char literals keep
+    only their quotes, so its length and line breaks match `code`.
+    """
+    tokens = []
+    masked = []
+    line = 1
+    for match in _TOKEN_RE.finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == IDENTIFIER and text in C_KEYWORDS:
+            kind = KEYWORD
+
+        if kind == COMMENT:
+            masked.append(_blank(text))
+        elif kind in (STRING, CHAR):
+            masked.append(_mask_literal(text))
+        else:
+            masked.append(text)
+
+        if kind != WHITESPACE:
+            tokens.append(Token(kind, text, line))
+        line += text.count('\n')
+    return tokens, ''.join(masked)
+
+
+def mask(code):
+    """The masked source of `code` and its number of comments, without the tokens.
+
+    Same result as tokenize(code), several times faster: only comments
+    and literals are handled one by one.
+    """
+    masked = []
+    comments = 0
+    for match in _MASK_RE.finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == COMMENT:
+            comments += 1
+            masked.append(_blank(text))
+        elif kind in (STRING, CHAR):
+            masked.append(_mask_literal(text))
+        else:
+            masked.append(text)
+    return ''.join(masked), comments
+
+
+class AnalysisContext:
+    """Lexed, memoized views of one submission for the static heuristics.
+
+    text        the source as submitted
+    code        the masked source: comment and literal contents blanked
+    lines       text split into lines (layout: length, indentation)
+    code_lines  code split into lines, index for index with `lines`
+    tokens      the token list, lexed on first use
+
+    Substring counts over `code` are memoized, so heuristics asking for
+    the same count share one scan.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.code, self.comment_count = mask(text)
+        self._counts = {}
+
+    def count(self, *substrings):
+        """Total occurrences of the substrings in the masked source."""
+        total = 0
+        for substring in substrings:
+            found = self._counts.get(substring)
+            if found is None:
+                found = self._counts[substring] = self.code.count(substring)
+            total += found
+        return total
+
+    @cached_property
+    def tokens(self):
+        return tokenize(self.text)[0]
+
+    @cached_property
+    def lines(self):
+        return self.text.split('\n')
+
+    @cached_property
+    def code_lines(self):
+        return self.code.split('\n')
+
+    @cached_property
+    def nonblank_lines(self):
+        """Lines of the submission with any content, comments included."""
+        return [line for line in self.lines if line.strip()]
+
+    @cached_property
+    def code_lower(self):
+        return self.code.lower()
+
+    @cached_property
+    def text_lower(self):
+        return self.text.lower()
+
+    @cached_property
+    def declaration_line_count(self):
+        """Lines of code naming one of the basic types (int, char, float, double)."""
+        return sum(1 for line in self.code_lines if any(t in line for t in DECLARATION_MARKERS))
+
+    @cached_property
+    def identifiers(self):
+        return [token.text for token in self.tokens if token.kind == IDENTIFIER]
+
+
+@lru_cache(maxsize=64)
+def analysis_context(code):
+    """Shared AnalysisContext for a submission (lexed once per process)."""
+    return AnalysisContext(code)
@@ -0,0 +1,126 @@
+"""The ML feature vector of C submissions, for one submission or a batch.
+
+feature_matrix(codes) returns an (N, F) float64 matrix whose columns
+follow FEATURE_NAMES. Each source goes through the lexer once: one
+masking pass (app.c_lexer.mask) gives the masked source and its comment
+count. One row of raw counts is read from it: line counts plus the
+substring counts of COUNTED. Every feature is then derived from those
+counts column by column, for the whole batch at once.
+
+CodeGrader.extract_code_features is the one-row case of the same
+computation, so training, batch prediction and single predictions get
+the same values bit for bit. Integer counts are exact in float64, and
+the two ratios (avg_line_length, function_complexity) divide the same
+integers as before. The substring counts keep str.count semantics
+(non-overlapping, over the masked source), which a combined scan could
+not reproduce for patterns such as '==' or 'calloc'.
+"""
+from app.c_lexer import AnalysisContext
+
+
+# Substrings counted in the masked source (str.count, as AnalysisContext.count)
+COUNTED = (
+    '(', 'main(', 'return ', ';', '{', '}', 'if ', 'else if', 'for ', 'while ', 'do ',
+    'switch ', 'case ', '*', '&', 'malloc', 'free', 'calloc', 'realloc', '[', ']',
+    '#include', 'printf(', 'scanf(', '&&', '||', '==', '!=', '<', '>', '<=', '>=',
+    '+', '-', '/', '%', 'NULL', 'null',
+)
+
+# Per-source values that are not substring counts
+DOCUMENT_VALUES = (
+    'nonblank_lines', 'text_length', 'declaration_lines', 'comments', 'stdio_include', 'line_length_sum',
+)
+
+FEATURE_NAMES = (
+    'total_lines', 'code_length', 'variable_declarations', 'function_calls', 'return_statements',
+    'semicolon_count', 'brace_balance', 'if_statements', 'loop_statements', 'switch_statements',
+    'pointer_operations', 'memory_functions', 'array_operations', 'include_statements', 'stdio_usage',
+    'printf_calls', 'scanf_calls', 'comment_lines', 'logical_operators', 'comparison_operators',
+    'arithmetic_operators', 'null_checks', 'decision_points', 'operators', 'operands',
+    'cyclomatic_complexity', 'avg_line_length', 'total_control_flow', 'nested_loops', 'function_complexity',
+)
+
+_RAW_COLUMNS = {name: index for index, name in enumerate(DOCUMENT_VALUES + COUNTED)}
+
+
+def raw_counts(ctx):
+    """The raw count row of one analysed submission, in DOCUMENT_VALUES + COUNTED order."""
+    nonblank = ctx.nonblank_lines
+    code = ctx.code
+    return [
+        len(nonblank),
+        len(ctx.text),
+        ctx.declaration_line_count,
+        ctx.comment_count,
+        1 if '#include <stdio.h>' in code else 0,
+        sum(len(line.strip()) for line in nonblank),
+    ] + [code.count(substring) for substring in COUNTED]
+
+
+def feature_matrix(codes, context=AnalysisContext):
+    """Feature rows of the sources: an (N, len(FEATURE_NAMES)) float64 matrix.
+
+    `context` builds the analysis of one source; the grader passes its
+    memoized analysis_context, training the plain AnalysisContext so a
+    stream of sources does not evict the contexts of recent grades.
+    """
+    import numpy as np
+
+    raw = np.array([raw_counts(context(code)) for code in codes], dtype=np.int64).reshape(-1, len(_RAW_COLUMNS))
+
+    def column(*names):
+        return raw[:, [_RAW_COLUMNS[name] for name in names]].sum(axis=1)
+
+    function_calls = column('(') - column('main(')
+    return_statements = column('return ')
+    if_statements = column('if ', 'else if')
+    loop_statements = column('for ', 'while ', 'do ')
+    switch_statements = column('switch ')
+    variable_declarations = column('declaration_lines')
+    logical_operators = column('&&', '||')
+    comparison_operators = column('==', '!=', '<', '>', '<=', '>=')
+    arithmetic_operators = column('+', '-', '*', '/', '%')
+
+    # Cyclomatic complexity approximation: count of decision points
+    decision_points = if_statements + loop_statements + switch_statements + column('case ')
+    total_control_flow = if_statements + loop_statements + switch_statements
+    total_lines = column('nonblank_lines')
+    line_length_sum = column('line_length_sum')
+
+    features = np.empty((len(raw), len(FEATURE_NAMES)), dtype=np.float64)
+    for index, values in enumerate((
+        total_lines,
+        column('text_length'),
+        variable_declarations,
+        function_calls,
+        return_statements,
+        column(';'),
+        np.abs(column('{') - column('}')),
+        if_statements,
+        loop_statements,
+        switch_statements,
+        column('*', '&'),
+        column('malloc', 'free', 'calloc', 'realloc'),
+        column('[', ']'),
+        column('#include'),
+        column('stdio_include'),
+        column('printf('),
+        column('scanf('),
+        column('comments'),
+        logical_operators,
+        comparison_operators,
+        arithmetic_operators,
+        column('NULL', 'null'),
+        decision_points,
+        # Halstead metrics approximation: count operators and operands
+        arithmetic_operators + logical_operators + comparison_operators,
+        variable_declarations + function_calls + return_statements,
+        decision_points + 1,
+        # Average line length (0 without lines)
+        np.divide(line_length_sum, total_lines, out=np.zeros(len(raw)), where=total_lines > 0),
+        total_control_flow,
+        np.maximum(0, loop_statements - 1),
+        total_control_flow / np.maximum(1, function_calls),
+    )):
+        features[:, index] = values
+    return features
@@ -0,0 +1,310 @@
+import subprocess
+import tempfile
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; eviction and run merges then run unlocked
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Default location and size bound, overridable per deployment
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'c_insight_compile_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Run an eviction pass after this many stores (or once this share of the bound is written)
+EVICT_EVERY_STORES = 32
+EVICT_TARGET_RATIO = 0.9
+
+# Bump when the stored diagnostics change for the same gcc, flags and code
+KEY_FORMAT = 2
+
+
+@lru_cache(maxsize=1)
+def gcc_version():
+    """First line of `gcc --version`, or None when gcc cannot be run."""
+    try:
+        result = subprocess.run(['gcc', '--version'], capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            return None
+        return result.stdout.split('\n', 1)[0].strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class CacheEntry:
+    """A cached gcc result: exit status, diagnostics and (optionally) the executable."""
+
+    def __init__(self, returncode, stderr, binary_path=None):
+        self.returncode = returncode
+        self.stderr = stderr
+        self.binary_path = binary_path
+
+
+class CompileCache:
+    """On-disk, content-addressed cache of gcc results shared by all workers.
+
+    Entries are keyed by SHA-256 of the source, the gcc version and the
+    compiler flags. Each entry is a JSON metadata file plus an optional
+    executable, written to a temp file and renamed into place so other
+    gunicorn workers never observe a partial entry. The metadata mtime is
+    the LRU clock: hits touch it, and eviction removes the oldest entries
+    until the cache is back under its size bound.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get('GRADING_CACHE_DIR', DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            try:
+                max_bytes = int(os.environ.get('GRADING_CACHE_MAX_MB', 0)) * 1024 * 1024 or DEFAULT_MAX_BYTES
+            except ValueError:
+                max_bytes = DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.enabled = os.environ.get('GRADING_CACHE_DISABLED', '0') != '1'
+
+        self._lock = threading.Lock()
+        self._stores_since_evict = 0
+        self._bytes_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, code, flags):
+        """Cache key for compiling `code` with `flags`, or None if gcc is unavailable."""
+        version = gcc_version()
+        if version is None:
+            return None
+        digest = hashlib.sha256()
+        digest.update(f"{KEY_FORMAT}:{version}".encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(' '.join(flags).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(code.encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def input_key(test_input):
+        """Key of one test input within an entry's stored run results."""
+        return hashlib.sha256((test_input or '').encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        bucket = os.path.join(self.cache_dir, key[:2])
+        return bucket, os.path.join(bucket, key + '.json'), os.path.join(bucket, key + '.bin')
+
+    def lookup(self, key):
+        """Return the CacheEntry for `key`, or None on a miss."""
+        if not self.enabled or key is None:
+            return None
+
+        _, meta_path, bin_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            binary_path = bin_path if meta.get('has_binary') else None
+            if binary_path and not os.path.exists(binary_path):
+                raise FileNotFoundError(binary_path)
+            # Touch the entry so LRU eviction keeps recently used results
+            os.utime(meta_path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return CacheEntry(meta.get('returncode'), meta.get('stderr', ''), binary_path)
+
+    def store(self, key, returncode, stderr, binary_path=None):
+        """Store a gcc result. The binary (if any) is copied into the cache."""
+        if not self.enabled or key is None:
+            return
+
+        bucket, meta_path, bin_path = self._paths(key)
+        written = 0
+        try:
+            os.makedirs(bucket, exist_ok=True)
+
+            if binary_path:
+                fd, tmp_bin = tempfile.mkstemp(dir=bucket, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as dst, open(binary_path, 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+                    os.chmod(tmp_bin, 0o755)
+                    os.replace(tmp_bin, bin_path)
+                except BaseException:
+                    os.unlink(tmp_bin)
+                    raise
+                written += os.path.getsize(bin_path)
+
+            # Metadata goes last: its presence marks the entry as complete
+            fd, tmp_meta = tempfile.mkstemp(dir=bucket, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'returncode': returncode, 'stderr': stderr,
+                               'has_binary': bool(binary_path)}, f)
+                os.replace(tmp_meta, meta_path)
+            except BaseException:
+                os.unlink(tmp_meta)
+                raise
+            written += os.path.getsize(meta_path)
+
+        except OSError as e:
+            logger.warning(f"Could not store compile cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            self.stores += 1
+            self._stores_since_evict += 1
+            self._bytes_since_evict += written
+            due = (self._stores_since_evict >= EVICT_EVERY_STORES or
+                   self._bytes_since_evict >= self.max_bytes // 8)
+            if due:
+                self._stores_since_evict = 0
+                self._bytes_since_evict = 0
+
+        if due:
+            self.evict()
+
+    def _runs_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.runs')
+
+    def lookup_runs(self, key):
+        """Stored results of running the entry's executable: {input_key: (output, error)}."""
+        if not self.enabled or key is None:
+            return {}
+        try:
+            with open(self._runs_path(key), 'r') as f:
+                return {input_key: tuple(result) for input_key, result in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def store_runs(self, key, runs):
+        """Add {input_key: (output, error)} results to the entry's stored runs.
+
+        The read-merge-write holds the cache's runs lock, so workers storing
+        runs of the same entry at once do not drop each other's results.
+        """
+        if not self.enabled or key is None or not runs:
+            return
+        runs_path = self._runs_path(key)
+        try:
+            os.makedirs(os.path.dirname(runs_path), exist_ok=True)
+            with self._file_lock('.runs.lock'):
+                merged = self.lookup_runs(key)
+                merged.update(runs)
+                fd, tmp_runs = tempfile.mkstemp(dir=os.path.dirname(runs_path), suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(merged, f)
+                    os.replace(tmp_runs, runs_path)
+                except BaseException:
+                    os.unlink(tmp_runs)
+                    raise
+        except OSError as e:
+            logger.warning(f"Could not store run results: {str(e)}")
+
+    @contextmanager
+    def _file_lock(self, name, blocking=True):
+        """flock on a file in the cache directory, shared by all workers.
+
+        Yields whether the lock is held: False only without blocking, when
+        another worker holds it.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, name), 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+
+    def _scan(self):
+        """List (mtime, size, meta_path, bin_path, runs_path) for every complete entry."""
+        entries = []
+        total = 0
+        if not os.path.isdir(self.cache_dir):
+            return entries, total
+        for bucket in os.listdir(self.cache_dir):
+            bucket_path = os.path.join(self.cache_dir, bucket)
+            if not os.path.isdir(bucket_path):
+                continue
+            for name in os.listdir(bucket_path):
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(bucket_path, name)
+                bin_path = meta_path[:-len('.json')] + '.bin'
+                runs_path = meta_path[:-len('.json')] + '.runs'
+                try:
+                    stat = os.stat(meta_path)
+                    size = stat.st_size
+                    for extra_path in (bin_path, runs_path):
+                        if os.path.exists(extra_path):
+                            size += os.path.getsize(extra_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, size, meta_path, bin_path, runs_path))
+                total += size
+        return entries, total
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its size bound."""
+        with self._file_lock('.evict.lock', blocking=False) as locked:
+            if not locked:
+                return  # Another worker is already evicting
+
+            entries, total = self._scan()
+            if total <= self.max_bytes:
+                return
+
+            target = int(self.max_bytes * EVICT_TARGET_RATIO)
+            removed = 0
+            for _, size, meta_path, bin_path, runs_path in sorted(entries):
+                if total <= target:
+                    break
+                for path in (meta_path, bin_path, runs_path):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning(f"Could not evict compile cache entry: {str(e)}")
+                total -= size
+                removed += 1
+
+            with self._lock:
+                self.evictions += removed
+            logger.info(f"Compile cache evicted {removed} entries, {total} bytes remain")
+
+    def stats(self):
+        """Hit/miss counters for this worker plus the current on-disk size."""
+        entries, total = self._scan()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'cache_dir': self.cache_dir,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'bytes': total,
+                'max_bytes': self.max_bytes
+            }
+
+
+# Shared instance used by the grader
+compile_cache = CompileCache()
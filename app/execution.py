@@ -0,0 +1,403 @@
+import subprocess
+import os
+import time
+import shutil
+import signal
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.compile_cache import compile_cache
+from app.sandbox import sandbox_pool, SandboxBusy
+from app.pch import precompiled_headers, prelude_diagnostics
+from app.workspace import workspace_manager
+
+
+logger = logging.getLogger(__name__)
+
+# gcc flags used to build student executables (part of the compile cache key).
+# Warnings are enabled so the same pass also yields the syntax diagnostics.
+COMPILE_FLAGS = ['-Wall', '-Wextra']
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return cast(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Concurrent test runs per submission (defaults to the host's cores) and the
+# time budget in seconds for running all of a submission's tests (SubmissionBudget)
+TEST_WORKERS = max(1, _env_number('GRADING_TEST_WORKERS', os.cpu_count() or 1))
+SUBMISSION_BUDGET = _env_number('GRADING_SUBMISSION_BUDGET', 15.0, float)
+
+BUDGET_EXCEEDED_ERROR = "Skipped - submission time budget exceeded"
+SANDBOX_BUSY_ERROR = "Skipped - no sandbox runner free"
+OUTPUT_LIMIT_ERROR = "Output limit exceeded"
+
+
+def _is_reusable(error):
+    """Whether a run result depends only on the binary and its input.
+
+    Timeouts, skipped runs and sandbox failures depend on load, so they are
+    never stored for reuse.
+    """
+    return error is None or error.startswith("Runtime error") or error == OUTPUT_LIMIT_ERROR
+
+class _BudgetSpent(Exception):
+    """The budget ran out while a run waited for its sandbox runner."""
+
+
+class SubmissionBudget:
+    """A submission's wall-clock time budget for its test runs.
+
+    Time is charged only while at least one of the submission's programs
+    is running. Waiting for a sandbox runner held by other submissions
+    costs nothing, while runs queued behind the submission's own runs
+    are charged (one of its programs is running).
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._charged = 0.0
+        self._running = 0
+        self._since = time.monotonic()
+
+    def _settle(self):
+        now = time.monotonic()
+        if self._running:
+            self._charged += now - self._since
+        self._since = now
+
+    def remaining(self):
+        with self._lock:
+            self._settle()
+            return self.seconds - self._charged
+
+    def start_run(self):
+        """Charge from now on for one more running program. Returns the remaining seconds."""
+        with self._lock:
+            self._settle()
+            self._running += 1
+            return self.seconds - self._charged
+
+    def end_run(self):
+        with self._lock:
+            self._settle()
+            self._running -= 1
+
+
+# Signals the kernel sends when a program hits one of the sandbox rlimits (none on Windows)
+LIMIT_SIGNALS = {
+    signum: message for signum, message in (
+        (getattr(signal, 'SIGXCPU', None), "CPU time limit exceeded"),
+        (getattr(signal, 'SIGXFSZ', None), "file size limit exceeded"),
+    ) if signum is not None
+}
+
+
+def run_gcc(args, workspace, timeout):
+    """Run gcc in a workspace: -pipe keeps the assembly in memory and TMPDIR
+    puts the object files gcc still writes on the workspace's filesystem.
+
+    Workspace paths are stripped from the diagnostics, which students see,
+    and so is a precompiled prelude (`-include`, app.pch).
+    """
+    result = subprocess.run(
+        ['gcc', '-pipe'] + args, capture_output=True, text=True, timeout=timeout,
+        env=dict(os.environ, TMPDIR=workspace.path)
+    )
+    if '-include' in args:
+        source = next(arg for arg in args if arg.endswith('.c'))
+        with open(source) as f:
+            code = f.read()
+        result.stderr = prelude_diagnostics(result.stderr, args[args.index('-include') + 1], code,
+                                            os.path.relpath(source, workspace.path))
+    result.stderr = result.stderr.replace(workspace.path + os.sep, '')
+    return result
+
+
+def _is_linker_line(line):
+    """True for diagnostics emitted by ld/collect2 rather than the compiler."""
+    stripped = line.strip()
+    return (stripped.startswith('collect2:') or '/ld:' in stripped or stripped.startswith('ld:') or
+            'undefined reference to' in stripped or '(.text' in stripped)
+
+
+class ExecutionSession:
+    """Compile a student's C code once and run the binary against many inputs.
+
+    Usage:
+        with ExecutionSession(code) as session:
+            for test_input in inputs:
+                output, error = session.run(test_input)
+
+    Compilation happens lazily on the first run (or an explicit compile()),
+    and the executable is reused for every following run. Timings are kept
+    separately for the compile step and for each run. Byte-identical
+    resubmissions reuse the executable from the compile cache.
+
+    The compile runs with warnings enabled, and its exit status and
+    diagnostics are kept (compile_returncode / compile_stderr) so the
+    syntax check can score them without invoking gcc a second time.
+    """
+
+    def __init__(self, code, compile_timeout=10, run_timeout=5, cache=None, reuse_runs=False):
+        self.code = code
+        self.cache = cache if cache is not None else compile_cache
+        self.cache_key = None
+        self.cache_hit = False
+        self.reuse_runs = reuse_runs
+        self.reused_runs = 0
+        self.compile_timeout = compile_timeout
+        self.run_timeout = run_timeout
+        self.compiled = None  # None = not attempted yet, True/False afterwards
+        self.compile_error = None
+        self.compile_returncode = None
+        self.compile_stderr = ''
+        self.compile_timed_out = False
+        self.compiler_missing = False
+        self.compile_time = None
+        # False once an outcome depended on load or the host (timeouts, missing gcc, ...)
+        self.reproducible = True
+        self.run_times = []
+        self._workspace = None
+        self.exe_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Empty the build workspace and return it to the worker's pool."""
+        if self._workspace is not None:
+            self._workspace.release()
+            self._workspace = None
+            self.exe_file = None
+
+    def compile(self):
+        """Compile the code once. Returns True if an executable was produced."""
+        if self.compiled is not None:
+            return self.compiled
+
+        start = time.monotonic()
+        try:
+            self._workspace = workspace_manager.acquire()
+            code_file = self._workspace.file('student_code.c')
+            with open(code_file, 'w') as f:
+                f.write(self.code)
+
+            exe_file = self._workspace.file('student_code.exe')
+
+            cache_key = self.cache_key = self.cache.key(self.code, COMPILE_FLAGS)
+            entry = self.cache.lookup(cache_key)
+            if entry is not None and entry.returncode == 0:
+                try:
+                    self._link_cached_binary(entry.binary_path, exe_file)
+                except OSError as e:
+                    # Evicted by another worker since the lookup: compile as on a miss
+                    logger.info(f"Cached executable vanished, recompiling: {str(e)}")
+                    entry = None
+            if entry is not None:
+                self.cache_hit = True
+                returncode, stderr = entry.returncode, entry.stderr
+            else:
+                # The prelude only makes gcc faster (run_gcc rewrites it out of the diagnostics), so it is not part of the key
+                compile_result = run_gcc(
+                    precompiled_headers.include_flags(self.code, COMPILE_FLAGS) +
+                    [code_file, '-o', exe_file] + COMPILE_FLAGS,
+                    self._workspace, self.compile_timeout
+                )
+                returncode, stderr = compile_result.returncode, compile_result.stderr
+                self.cache.store(cache_key, returncode, stderr,
+                                 exe_file if returncode == 0 else None)
+
+            self.compile_returncode = returncode
+            self.compile_stderr = stderr
+            if returncode != 0:
+                self.compile_error = f"Compilation failed: {stderr[:200]}"
+                self.compiled = False
+            else:
+                self.exe_file = exe_file
+                self.compiled = True
+
+        except subprocess.TimeoutExpired:
+            self.compile_timed_out = True
+            self.reproducible = False
+            self.compile_error = "Execution timed out"
+            self.compiled = False
+        except FileNotFoundError as e:
+            logger.warning(f"GCC not found: {str(e)}")
+            self.compiler_missing = True
+            self.reproducible = False
+            self.compile_error = f"Execution error: {str(e)}"
+            self.compiled = False
+        except Exception as e:
+            logger.error(f"Error compiling submission: {str(e)}")
+            self.reproducible = False
+            self.compile_error = f"Execution error: {str(e)}"
+            self.compiled = False
+        finally:
+            self.compile_time = time.monotonic() - start
+
+        return self.compiled
+
+    def syntax_diagnostics(self):
+        """Exit status and diagnostics of the compile step, ignoring link failures.
+
+        Returns (returncode, stderr) as a `gcc -fsyntax-only` run would have
+        reported them: a build that only failed in the linker (e.g. an
+        undefined function) counts as syntactically clean.
+        """
+        self.compile()
+        stderr = self.compile_stderr or ''
+        if self.compile_returncode in (None, 0):
+            return self.compile_returncode, stderr
+
+        compiler_lines = [line for line in stderr.split('\n') if not _is_linker_line(line)]
+        if not any('error:' in line for line in compiler_lines):
+            return 0, '\n'.join(compiler_lines)
+        return self.compile_returncode, stderr
+
+    def _link_cached_binary(self, cached_path, exe_file):
+        """Hard-link the cached executable into the session (copy across filesystems)."""
+        try:
+            os.link(cached_path, exe_file)
+        except OSError:
+            shutil.copy2(cached_path, exe_file)
+
+    def run(self, test_input):
+        """Run the compiled binary with test input. Returns (output, error)."""
+        if not self.compile():
+            return None, self.compile_error
+
+        try:
+            output, error, elapsed = self._execute(test_input, self.run_timeout, wait=SUBMISSION_BUDGET)
+        except SandboxBusy:
+            self.reproducible = False
+            return None, SANDBOX_BUSY_ERROR
+        self.run_times.append(elapsed)
+        return output, error
+
+    def run_all(self, test_inputs, max_workers=None, budget=None):
+        """Run every test input concurrently on a bounded pool.
+
+        Returns a list of (output, error) in the same order as test_inputs.
+        All runs share one time budget (SubmissionBudget): a run never
+        outlives it, and runs that have not started when it expires are
+        skipped. Waiting for a sandbox runner that other submissions hold is
+        not charged. If no runner becomes free within the remaining budget,
+        run_all raises SandboxBusy once the other runs are done: the missing
+        results say nothing about the code, so it is graded again later.
+
+        Deterministic results are stored with the cached executable. With
+        reuse_runs, inputs this exact binary already ran are answered from
+        there, so only new or changed inputs execute (used by regrades).
+        """
+        if not self.compile():
+            return [(None, self.compile_error) for _ in test_inputs]
+        if not test_inputs:
+            return []
+
+        input_keys = [self.cache.input_key(test_input) for test_input in test_inputs]
+        stored = self.cache.lookup_runs(self.cache_key) if self.reuse_runs else {}
+        pending = [i for i, input_key in enumerate(input_keys) if input_key not in stored]
+
+        max_workers = max_workers or TEST_WORKERS
+        budget = SubmissionBudget(SUBMISSION_BUDGET if budget is None else budget)
+        busy = threading.Event()
+
+        def run_one(test_input):
+            remaining = budget.remaining()
+            if remaining <= 0:
+                return None, BUDGET_EXCEEDED_ERROR, 0.0
+            if busy.is_set():
+                return None, SANDBOX_BUSY_ERROR, 0.0
+            running = []
+
+            def started():
+                # The timeout is what is left once the run can start
+                running.append(True)
+                timeout = min(self.run_timeout, budget.start_run())
+                if timeout <= 0:
+                    raise _BudgetSpent()
+                return timeout
+
+            try:
+                return self._execute(test_input, self.run_timeout, wait=remaining, started=started)
+            except SandboxBusy:
+                if budget.remaining() <= 0:
+                    # The submission's own runs used up the budget meanwhile
+                    return None, BUDGET_EXCEEDED_ERROR, 0.0
+                busy.set()
+                return None, SANDBOX_BUSY_ERROR, 0.0
+            except _BudgetSpent:
+                return None, BUDGET_EXCEEDED_ERROR, 0.0
+            finally:
+                if running:
+                    budget.end_run()
+
+        pending_inputs = [test_inputs[i] for i in pending]
+        if max_workers == 1 or len(pending_inputs) <= 1:
+            results = [run_one(test_input) for test_input in pending_inputs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(pending_inputs))) as pool:
+                results = list(pool.map(run_one, pending_inputs))
+
+        self.run_times.extend(elapsed for _, _, elapsed in results)
+        self.reused_runs += len(test_inputs) - len(pending)
+
+        executed = dict(zip(pending, results))
+        if not all(_is_reusable(error) for _, error, _ in results):
+            self.reproducible = False
+        self.cache.store_runs(self.cache_key, {
+            input_keys[i]: (output, error)
+            for i, (output, error, _) in executed.items() if _is_reusable(error)
+        })
+        if busy.is_set():
+            raise SandboxBusy("No sandbox runner became free within the submission's time budget")
+        return [executed[i][:2] if i in executed else stored[input_keys[i]]
+                for i in range(len(test_inputs))]
+
+    def _execute(self, test_input, timeout, wait=None, started=None):
+        """Run the binary once in the sandbox. Returns (output, error, elapsed seconds).
+
+        `wait` and `started` are passed to SandboxPool.run; SandboxBusy
+        (no runner within `wait`) propagates.
+        """
+        start = time.monotonic()
+        try:
+            run_result = sandbox_pool.run([self.exe_file], test_input, timeout, wait=wait, started=started)
+
+            if run_result.get('output_limit_exceeded'):
+                return None, OUTPUT_LIMIT_ERROR, run_result['elapsed']
+
+            if run_result['timed_out']:
+                return None, "Execution timed out", run_result['elapsed']
+
+            if run_result['returncode'] != 0:
+                limit_message = LIMIT_SIGNALS.get(-run_result['returncode'])
+                if limit_message:
+                    return None, f"Runtime error: {limit_message}", run_result['elapsed']
+                return None, f"Runtime error: {run_result['stderr'][:200]}", run_result['elapsed']
+
+            return run_result['stdout'].strip(), None, run_result['elapsed']
+
+        except (SandboxBusy, _BudgetSpent):
+            raise
+        except Exception as e:
+            logger.error(f"Error running submission: {str(e)}")
+            return None, f"Execution error: {str(e)}", time.monotonic() - start
+
+    def timings(self):
+        """Compile time and per-run times in seconds."""
+        return {
+            'compile': round(self.compile_time, 4) if self.compile_time is not None else None,
+            'compile_cache_hit': self.cache_hit,
+            'runs': [round(t, 4) for t in self.run_times],
+            'reused_runs': self.reused_runs
+        }
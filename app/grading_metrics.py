@@ -0,0 +1,184 @@
+"""Per-stage grading latency: one structured record per grade, plus histograms.
+
+grade_submission and bulk regrades time each grading stage with a
+monotonic clock:
+
+    activity_load        grading context (plan) and submission time
+    result_lookup        stored result check (app.grading_results)
+    requirement_check    required constructs found in the code
+    syntax_check         gcc diagnostics, including the compile below
+    compile              the compile itself (0 on a compile cache hit)
+    test_execution       all test runs of the submission, wall clock
+    test_run             each single test run (one sample per run)
+    output_comparison    comparing outputs with the expected ones
+    static_analysis      logic score and structure analysis
+    ml_prediction        the ML models' scores (only with GRADING_ML_BLEND)
+    feedback_formatting  building the feedback sections
+    total
+
+requirement_extraction is sampled when an activity's plan is compiled.
+
+Each grade logs a `grading_timings {...}` JSON line, and the record is
+stored in `submissions.grading_timings` once migrate_db.py has added the column.
+Per worker, every stage keeps cumulative bucket counts since start and a
+window of recent samples for p50/p95/p99. The admin endpoint
+/admin/grading/timings serves them.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from app.schema import SchemaCheck, missing_columns
+
+
+logger = logging.getLogger(__name__)
+
+# Recent samples per stage used for the percentiles
+try:
+    TIMING_WINDOW = max(10, int(os.environ.get('GRADING_TIMING_WINDOW', 1000)))
+except ValueError:
+    TIMING_WINDOW = 1000
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+# Grading pipeline stages (app.grading_pipeline) and the timing stage they count towards
+PIPELINE_STAGES = {
+    'requirements': 'requirement_check',
+    'syntax': 'syntax_check',
+    'test_runs': 'test_execution',
+    'tests': 'output_comparison',
+    'logic': 'static_analysis',
+    'structure_feedback': 'static_analysis',
+    'ml_scores': 'ml_prediction',
+    'feedback': 'feedback_formatting',
+}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class StageClock:
+    """Times the stages of one grade."""
+
+    def __init__(self):
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0) + _ms(time.perf_counter() - start)
+
+    def elapsed_ms(self):
+        return _ms(time.perf_counter() - self._start)
+
+
+def grading_timings(grading_result, clock=None):
+    """The timing record of a grading result (see the module docstring)."""
+    stages = dict(clock.stages) if clock else {}
+    for entry in grading_result.get('stage_trace', []):
+        stage = PIPELINE_STAGES.get(entry['stage'])
+        if stage:
+            stages[stage] = round(stages.get(stage, 0) + entry['ms'], 2)
+
+    execution = grading_result.get('execution_timings') or {}
+    if execution.get('compile') is not None:
+        stages['compile'] = _ms(execution['compile'])
+
+    record = {
+        'stages': stages,
+        'test_runs': [_ms(run) for run in execution.get('runs', [])],
+        'compile_cache_hit': execution.get('compile_cache_hit', False),
+        'stored_result': grading_result.get('stored_result', False),
+    }
+    if clock:
+        record['total'] = clock.elapsed_ms()
+    elif grading_result.get('stage_trace'):
+        record['total'] = grading_result['stage_trace'][0]['total_ms']
+    return record
+
+
+class StageHistogram:
+    def __init__(self, window):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.recent.append(ms)
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def percentile(p):
+            return recent[min(len(recent) - 1, int(len(recent) * p))] if recent else None
+
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count, 2) if self.count else None,
+            'max_ms': self.max,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'buckets': {
+                (f"le_{bound}" if i < len(BUCKET_BOUNDS_MS) else 'inf'): count
+                for i, (bound, count) in enumerate(zip(BUCKET_BOUNDS_MS + (None,), self.buckets))
+            },
+        }
+
+
+class GradingMetrics:
+    """Per-worker stage histograms, and the submissions.grading_timings column."""
+
+    def __init__(self, window=TIMING_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._column = SchemaCheck('Grading timings storage', lambda cur: not missing_columns(
+            cur, 'submissions', ['grading_timings']))
+        self.started_at = time.time()
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = StageHistogram(self.window)
+            histogram.observe(ms)
+
+    def record(self, timings, **fields):
+        """Add a grade's timing record to the histograms and log it as one JSON line."""
+        for stage, ms in timings['stages'].items():
+            self.observe(stage, ms)
+        for ms in timings['test_runs']:
+            self.observe('test_run', ms)
+        if 'total' in timings:
+            self.observe('total', timings['total'])
+        logger.info("grading_timings " + json.dumps(dict(fields, **timings), default=str))
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())}
+        return {'since': self.started_at, 'window': self.window, 'stages': stages}
+
+    def ensure_column(self, cur):
+        """Whether submissions.grading_timings exists (added by migrate_db.py)."""
+        return self._column.ready(cur)
+
+
+# Shared per-worker metrics
+grading_metrics = GradingMetrics()
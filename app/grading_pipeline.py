@@ -0,0 +1,306 @@
+"""Demand-driven grading: named stages evaluated lazily and at most once.
+
+A stage is a function of the current run. It pulls whatever it needs
+through run.get('<stage>'), so a stage runs only when a later stage (in
+the end the 'result' stage) asks for its value. A stage runs at most
+once per submission. Examples: syntax errors never demand the test
+runs, and the structure analysis is shared by the semantic feedback and
+the feedback sections instead of being computed twice.
+
+Every run keeps a trace of the stages it evaluated, in order:
+
+    {'stage': 'tests', 'requested_by': 'scores', 'ms': 1.2, 'total_ms': 84.0}
+
+`ms` is the stage's own time and `total_ms` includes the stages it
+pulled in. grade_code returns the trace with the grading result.
+"""
+import datetime
+import json
+import time
+import logging
+from app import ml_models
+from app.ml_models import ml_model_store
+from app.ml_batcher import ml_batcher
+
+
+logger = logging.getLogger(__name__)
+
+# Below this syntax score a submission is not run or analysed further
+SYNTAX_PASS_SCORE = 85
+
+
+class StagePipeline:
+    """A registry of named stages. Call start() for each submission."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name):
+        """Decorator registering `func(run)` as the stage `name`."""
+        def register(func):
+            self.stages[name] = func
+            return func
+        return register
+
+    def start(self, **inputs):
+        return PipelineRun(self, inputs)
+
+
+class PipelineRun:
+    """One submission's evaluation: inputs, memoized stage values and the trace."""
+
+    def __init__(self, pipeline, inputs):
+        self.pipeline = pipeline
+        self.inputs = inputs
+        self.trace = []
+        self._values = {}
+        self._active = []
+
+    def __getattr__(self, name):
+        # Inputs read as attributes: run.code, run.context, run.grader, ...
+        try:
+            return self.__dict__['inputs'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, name):
+        """Value of stage `name`, evaluating it (and what it needs) on first use."""
+        if name in self._values:
+            return self._values[name]
+        if name not in self.pipeline.stages:
+            raise KeyError(f"Unknown grading stage: {name}")
+        if any(frame['stage'] == name for frame in self._active):
+            raise RuntimeError(f"Grading stage {name} depends on itself")
+
+        entry = {'stage': name, 'requested_by': self._active[-1]['stage'] if self._active else None}
+        self.trace.append(entry)
+        frame = {'stage': name, 'children': 0.0}
+        self._active.append(frame)
+        start = time.perf_counter()
+        try:
+            value = self.pipeline.stages[name](self)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._active.pop()
+            if self._active:
+                self._active[-1]['children'] += elapsed
+            entry['ms'] = round((elapsed - frame['children']) * 1000, 2)
+            entry['total_ms'] = round(elapsed * 1000, 2)
+
+        self._values[name] = value
+        return value
+
+    def evaluated(self):
+        return [entry['stage'] for entry in self.trace]
+
+    def skipped(self):
+        """Registered stages this submission never needed."""
+        return [name for name in self.pipeline.stages if name not in self._values]
+
+
+grading_pipeline = StagePipeline()
+stage = grading_pipeline.stage
+
+
+def submission_time(submitted_at):
+    """submitted_at as a datetime; now for a submission without a time."""
+    if submitted_at:
+        if isinstance(submitted_at, str):
+            submitted_at = datetime.datetime.strptime(submitted_at, '%Y-%m-%d %H:%M:%S')
+        return submitted_at
+    return datetime.datetime.now()
+
+
+def overdue_penalty(due_date, submitted_at):
+    """Percentage points deducted: 20 per started week past the due date."""
+    penalty = 0
+    if due_date and submitted_at and submitted_at > due_date:
+        # Calculate total seconds overdue
+        total_seconds_overdue = (submitted_at - due_date).total_seconds()
+
+        # Calculate weeks overdue based on seconds (1 week = 604,800 seconds)
+        seconds_per_week = 7 * 24 * 3600  # 604,800
+        weeks_overdue = total_seconds_overdue // seconds_per_week
+        if total_seconds_overdue % seconds_per_week > 0:  # Partial week counts as full week
+            weeks_overdue += 1
+
+        penalty = weeks_overdue * 20
+    return penalty
+
+
+@stage('submitted_at')
+def submitted_at_stage(run):
+    return submission_time(run.submitted_at)
+
+
+@stage('overdue_penalty')
+def overdue_penalty_stage(run):
+    return overdue_penalty(run.context['due_date'], run.get('submitted_at'))
+
+
+@stage('requirements')
+def requirements_stage(run):
+    """(requirement_score, requirement_feedback) against the activity's extracted requirements."""
+    return run.grader.check_activity_requirements(run.code, run.context['requirements'])
+
+
+@stage('syntax')
+def syntax_stage(run):
+    """(syntax_score, syntax_feedback). The compile also builds the binary for the tests."""
+    return run.grader.check_syntax(run.code, session=run.session)
+
+
+@stage('syntax_ok')
+def syntax_ok_stage(run):
+    return run.get('syntax')[0] >= SYNTAX_PASS_SCORE
+
+
+@stage('test_runs')
+def test_runs_stage(run):
+    """(output, error) per test case, all run concurrently against the compiled binary."""
+    return run.session.run_all([test_case['input'] for test_case in run.context['test_cases']])
+
+
+@stage('tests')
+def tests_stage(run):
+    """(test_correctness_score, test_details, test_feedback)."""
+    test_cases = run.context['test_cases']
+    if not test_cases:
+        # Neutral score when no tests available
+        return 50, [], "No test cases defined for this activity - using static analysis only."
+    return run.grader.evaluate_test_results(test_cases, run.get('test_runs'))
+
+
+@stage('logic')
+def logic_stage(run):
+    """Rule-based logic/semantics score."""
+    description = run.context['description']
+    instructions = run.context['instructions']
+    activity_text = f"{description} {instructions}" if description or instructions else ""
+    logic_score, _ = run.grader.analyze_c_code_logic(run.code, run.context['requirements'], activity_text)
+    return logic_score
+
+
+@stage('ml_scores')
+def ml_scores_stage(run):
+    """(correctness, logic, syntax) predicted by the served ML models, or None without models."""
+    models = ml_model_store.get()
+    if models is None:
+        return None
+    try:
+        feature_vector = list(run.grader.extract_code_features(run.code).values())
+        # Batched with concurrent grades (app.ml_batcher); one or three forests, or the distilled student
+        prediction = ml_batcher.predict(models, feature_vector)
+    except Exception as e:
+        logger.error(f"Error in ML prediction: {str(e)}")
+        return None
+    # Ensure predictions are within valid range
+    return tuple(max(0.0, min(100.0, float(value))) for value in prediction)
+
+
+@stage('structure_feedback')
+def structure_feedback_stage(run):
+    """Code length and structure remarks, shown with the semantic score and in its section."""
+    return run.grader.analyze_c_code_detailed_feedback(run.code, run.context['requirements'])
+
+
+@stage('scores')
+def scores_stage(run):
+    """Criterion scores after the overdue penalty, the weighted total and the summary line."""
+    context = run.context
+    correctness_w = context['correctness_w']
+    syntax_w = context['syntax_w']
+    logic_w = context['logic_w']
+
+    syntax_score, _ = run.get('syntax')
+    if not run.get('syntax_ok'):
+        # Syntax errors: all scores are zero and nothing is run or analysed
+        correctness_score = syntax_score = logic_score = 0
+        test_correctness_score = 0
+        ast_feedback = "Submission has syntax errors; grading scores set to zero."
+    else:
+        test_correctness_score, _, test_feedback = run.get('tests')
+        logic_score = run.get('logic')
+        # Correctness is based entirely on test case results, Logic on static analysis
+        correctness_score = test_correctness_score
+        ml_scores = run.get('ml_scores') if ml_models.BLEND > 0 else None
+        if ml_scores:
+            # Opt-in: part of each score comes from the trained models
+            blend = ml_models.BLEND
+            ml_correctness, ml_logic, ml_syntax = ml_scores
+            correctness_score = (1 - blend) * correctness_score + blend * ml_correctness
+            logic_score = (1 - blend) * logic_score + blend * ml_logic
+            syntax_score = (1 - blend) * syntax_score + blend * ml_syntax
+        ast_feedback = f"{test_feedback}, {run.get('structure_feedback')}"
+
+    # Update feedback with final scores
+    ast_feedback = f"Correctness: {correctness_score:.1f}%, Semantic: {logic_score:.1f}%, Syntax: {syntax_score:.1f}%. {ast_feedback}"
+
+    # Apply overdue penalty to individual criteria
+    overdue_penalty = run.get('overdue_penalty')
+    if overdue_penalty > 0:
+        total_weight = correctness_w + syntax_w + logic_w
+        if total_weight > 0:
+            penalty_correctness = round(overdue_penalty * (correctness_w / total_weight), 1)
+            penalty_syntax = round(overdue_penalty * (syntax_w / total_weight), 1)
+            penalty_logic = round(overdue_penalty * (logic_w / total_weight), 1)
+
+            correctness_score = (correctness_score * correctness_w / 100)
+            syntax_score = (syntax_score * syntax_w / 100)
+            logic_score = (logic_score * logic_w / 100)
+
+            correctness_score = max(0, correctness_score - penalty_correctness)
+            syntax_score = max(0, syntax_score - penalty_syntax)
+            logic_score = max(0, logic_score - penalty_logic)
+
+            correctness_score = (correctness_score * 100 / correctness_w)
+            syntax_score = (syntax_score * 100 / syntax_w)
+            logic_score = (logic_score * 100 / logic_w)
+
+    # Calculate weighted scores
+    total_score = (
+        (correctness_score * correctness_w / 100) +
+        (syntax_score * syntax_w / 100) +
+        (logic_score * logic_w / 100)
+    )
+
+    return {
+        'correctness': correctness_score,
+        'syntax': syntax_score,
+        'logic': logic_score,
+        'total': total_score,
+        'test_correctness': test_correctness_score,
+        'summary': ast_feedback,
+    }
+
+
+@stage('feedback')
+def feedback_stage(run):
+    """The three-part feedback shown to the student, as a dict."""
+    scores = run.get('scores')
+    syntax_ok = run.get('syntax_ok')
+    return run.grader.format_comprehensive_feedback(
+        scores['syntax'], run.get('syntax')[1],
+        scores['test_correctness'], run.get('tests')[1] if syntax_ok else [],
+        scores['logic'], scores['summary'],
+        run.get('overdue_penalty'),
+        run.code,
+        run.context['requirements'],
+        detailed_feedback=run.get('structure_feedback') if syntax_ok else None
+    )
+
+
+@stage('result')
+def result_stage(run):
+    scores = run.get('scores')
+    feedback = run.get('feedback')
+    requirement_score, _ = run.get('requirements')
+    return {
+        'correctness_score': int(scores['correctness']),
+        'syntax_score': int(scores['syntax']),
+        'logic_score': int(scores['logic']),
+        'requirement_score': int(requirement_score),
+        'total_score': int(scores['total']),
+        # JSON string for database storage
+        'feedback': json.dumps(feedback),
+    }
@@ -0,0 +1,213 @@
+"""Versioned grading plans, compiled when an activity is saved.
+
+A plan holds everything grading needs from an activity:
+- the rubric weights and the due date;
+- the requirements extracted from the description and instructions;
+- the validated test cases, with each expected output already stripped
+  of prompts.
+
+create_activity and manage_activity compile the plan when they save the
+activity. It is stored in `activities.grading_plan`, and each save bumps
+`activities.grading_plan_version`. migrate_db.py adds the two columns
+(app.schema); until it has run, plans are off and grading reads the
+activity directly.
+
+Every worker keeps recently used plans in an LRU keyed by
+(activity id, version). Grading a submission then costs one small
+version lookup instead of re-reading and re-parsing the activity.
+Activities saved before plans existed are compiled on first grade and
+cached the same way.
+"""
+import os
+import json
+import time
+import datetime
+import threading
+import logging
+from collections import OrderedDict
+from app import mysql
+from app.grading_metrics import grading_metrics
+from app.schema import SchemaCheck, missing_columns
+import MySQLdb
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when compile_plan changes: stored plans of another format are recompiled
+PLAN_FORMAT = 1
+
+# Plans kept per worker
+try:
+    PLAN_CACHE_SIZE = max(1, int(os.environ.get('GRADING_PLAN_CACHE_SIZE', 256)))
+except ValueError:
+    PLAN_CACHE_SIZE = 256
+
+DUE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+ACTIVITY_FIELDS = """description, instructions, due_date, correctness_weight,
+                     syntax_weight, logic_weight, test_cases_json"""
+
+
+def _weight(value, default):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def compile_plan(grader, activity):
+    """Build the JSON-serializable plan for an activities row."""
+    description = activity['description']
+    instructions = activity['instructions']
+
+    due_date = activity['due_date']
+    if isinstance(due_date, datetime.datetime):
+        due_date = due_date.strftime(DUE_DATE_FORMAT)
+
+    # Extract requirements from activity text for semantic analysis
+    activity_text = f"{description} {instructions}" if description or instructions else ""
+    start = time.perf_counter()
+    requirements = grader.extract_activity_requirements(activity_text) if activity_text else None
+    grading_metrics.observe('requirement_extraction', round((time.perf_counter() - start) * 1000, 2))
+
+    test_cases = grader.validate_test_cases(activity['test_cases_json'])
+    for test_case in test_cases:
+        # compare_outputs_flexible would otherwise clean the expected output on every comparison
+        test_case['expected_clean'] = grader.clean_prompts(test_case['expected'].strip(), grader.additional_keywords)
+
+    return {
+        'format': PLAN_FORMAT,
+        'description': description,
+        'instructions': instructions,
+        'due_date': due_date,
+        'correctness_w': _weight(activity['correctness_weight'], 50.0),
+        'syntax_w': _weight(activity['syntax_weight'], 30.0),
+        'logic_w': _weight(activity['logic_weight'], 20.0),
+        'requirements': requirements,
+        'test_cases': test_cases,
+    }
+
+
+def plan_context(activity_id, plan, version=None):
+    """The grading context (see CodeGrader.grade_code) for a compiled plan.
+
+    plan_version is None when the plan is not versioned (no plan columns).
+    """
+    due_date = plan['due_date']
+    if due_date and isinstance(due_date, str):
+        try:
+            due_date = datetime.datetime.strptime(due_date, DUE_DATE_FORMAT)
+        except ValueError:
+            due_date = None
+
+    context = dict(plan)
+    del context['format']
+    context['activity_id'] = activity_id
+    context['plan_version'] = version
+    context['due_date'] = due_date
+    return context
+
+
+class GradingPlans:
+    """Stores plans with their activity and caches them per worker."""
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._schema = SchemaCheck('Grading plans', lambda cur: not missing_columns(
+            cur, 'activities', ['grading_plan', 'grading_plan_version']))
+        self.hits = 0
+        self.misses = 0
+
+    def ensure_schema(self, cur):
+        """Whether the plan columns exist (added by migrate_db.py)."""
+        return self._schema.ready(cur)
+
+    def save(self, cur, activity_id, grader):
+        """Compile and store the plan of a just-saved activity. Returns the new version.
+
+        Uses the caller's cursor, so the plan is committed with the activity.
+        """
+        if not self.ensure_schema(cur):
+            return None
+        cur.execute(f"SELECT {ACTIVITY_FIELDS} FROM activities WHERE id = %s", (activity_id,))
+        activity = cur.fetchone()
+        if not activity:
+            return None
+
+        try:
+            plan = compile_plan(grader, activity)
+        except Exception as e:
+            # Still bump the version so no worker keeps the old plan; graders compile from the row
+            logger.error(f"Error compiling grading plan for activity {activity_id}: {str(e)}")
+            plan = None
+
+        cur.execute("""
+            UPDATE activities
+            SET grading_plan = %s, grading_plan_version = grading_plan_version + 1
+            WHERE id = %s
+        """, (json.dumps(plan) if plan else None, activity_id))
+        # Not cached here: workers cache what they read back, i.e. only committed plans
+        cur.execute("SELECT grading_plan_version FROM activities WHERE id = %s", (activity_id,))
+        return cur.fetchone()['grading_plan_version']
+
+    def context(self, activity_id, grader):
+        """Grading context of an activity from its current plan, or None if it does not exist."""
+        cur = mysql.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
+        try:
+            if not self.ensure_schema(cur):
+                # No plan columns: compile from the row on every grade
+                cur.execute(f"SELECT {ACTIVITY_FIELDS} FROM activities WHERE id = %s", (activity_id,))
+                activity = cur.fetchone()
+                return plan_context(activity_id, compile_plan(grader, activity)) if activity else None
+
+            cur.execute("SELECT grading_plan_version FROM activities WHERE id = %s", (activity_id,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            key = (activity_id, row['grading_plan_version'])
+            with self._lock:
+                context = self._cache.get(key)
+                if context is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return context
+                self.misses += 1
+
+            cur.execute(f"SELECT {ACTIVITY_FIELDS}, grading_plan FROM activities WHERE id = %s", (activity_id,))
+            activity = cur.fetchone()
+            if not activity:
+                return None
+        finally:
+            cur.close()
+
+        plan = None
+        if activity['grading_plan']:
+            try:
+                plan = json.loads(activity['grading_plan'])
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.error(f"Invalid grading plan for activity {activity_id}: {str(e)}")
+        if not plan or plan.get('format') != PLAN_FORMAT:
+            # Saved before plans existed (or by an older format): compile it here,
+            # it is stored the next time the activity is saved
+            plan = compile_plan(grader, activity)
+
+        context = plan_context(activity_id, plan, key[1])
+        self._remember(key, context)
+        return context
+
+    def _remember(self, key, context):
+        with self._lock:
+            self._cache[key] = context
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared per-worker plan cache
+grading_plans = GradingPlans()
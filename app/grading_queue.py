@@ -0,0 +1,244 @@
+import os
+import json
+import threading
+import logging
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app import mysql
+from app.grading_metrics import grading_metrics
+from app.schema import SchemaCheck, missing_columns
+import MySQLdb
+
+
+logger = logging.getLogger(__name__)
+
+# Grade in the background instead of inside the request (set GRADING_ASYNC=0 to disable)
+ASYNC_GRADING = os.environ.get('GRADING_ASYNC', '1') != '0'
+
+# Submissions graded concurrently per gunicorn worker
+try:
+    ASYNC_WORKERS = max(1, int(os.environ.get('GRADING_ASYNC_WORKERS', 2)))
+except ValueError:
+    ASYNC_WORKERS = 2
+
+# Jobs that failed for lack of sandbox runners (a retryable error) are graded
+# again up to GRADING_RETRY_ATTEMPTS times, GRADING_RETRY_DELAY seconds apart
+try:
+    RETRY_ATTEMPTS = max(0, int(os.environ.get('GRADING_RETRY_ATTEMPTS', 3)))
+except ValueError:
+    RETRY_ATTEMPTS = 3
+
+try:
+    RETRY_DELAY = max(0.0, float(os.environ.get('GRADING_RETRY_DELAY', 5)))
+except ValueError:
+    RETRY_DELAY = 5.0
+
+# How many finished jobs to remember for the status endpoint
+STATUS_HISTORY = 1000
+
+# A submission still ungraded this many seconds after it was submitted, with
+# no job in this worker, is reported as unknown: its job was lost (e.g. the
+# worker that queued it restarted) or is stuck
+try:
+    STATUS_TIMEOUT = max(1.0, float(os.environ.get('GRADING_STATUS_TIMEOUT', 900)))
+except ValueError:
+    STATUS_TIMEOUT = 900.0
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# The student resubmitted while this job ran; the newer job's grade counts
+SUPERSEDED = 'superseded'
+# Ungraded past STATUS_TIMEOUT without a known job
+UNKNOWN = 'unknown'
+
+# submissions.grading_error keeps a failed job's error for every worker (added by migrate_db.py)
+grading_error_column = SchemaCheck('Persisted grading errors',
+                                   lambda cur: not missing_columns(cur, 'submissions', ['grading_error']))
+
+
+def store_grading_error(cur, submission_id, code, error):
+    """Record that grading `code` failed, unless the submission was resubmitted or graded since."""
+    if not grading_error_column.ready(cur):
+        return
+    cur.execute("""
+        UPDATE submissions SET grading_error=%s
+        WHERE id=%s AND code=%s AND correctness_score IS NULL
+    """, (error, submission_id, code))
+
+
+def grading_state(submission, job=None):
+    """Status endpoint state of a submission row (scores, submitted_at, grading_error) and its job.
+
+    `job` is this worker's live job state, if it has one. Returns a dict
+    with 'status' and, for failures, 'error'; None once the scores are in.
+    """
+    if job and job['status'] != DONE:
+        state = {'status': job['status']}
+        if job.get('error'):
+            state['error'] = job['error']
+        return state
+    if submission['correctness_score'] is not None:
+        return None
+    if submission.get('grading_error'):
+        return {'status': FAILED, 'error': submission['grading_error']}
+    submitted_at = submission.get('submitted_at')
+    if submitted_at and datetime.now() - submitted_at > timedelta(seconds=STATUS_TIMEOUT):
+        return {'status': UNKNOWN, 'error': 'Grading did not finish. Submit your code again to have it graded.'}
+    return {'status': QUEUED}
+
+
+def store_grading_result(cur, submission_id, grading_result):
+    """Write the scores, feedback and stage timings of a grading result to the submission row."""
+    timings = grading_result.get('grading_timings')
+    if timings is not None and grading_metrics.ensure_column(cur):
+        cur.execute("""
+            UPDATE submissions
+            SET correctness_score=%s, syntax_score=%s, logic_score=%s, feedback=%s, grading_timings=%s
+            WHERE id=%s
+        """, (
+            grading_result['correctness_score'],
+            grading_result['syntax_score'],
+            grading_result['logic_score'],
+            grading_result['feedback'],
+            json.dumps(timings),
+            submission_id
+        ))
+        return
+
+    cur.execute("""
+        UPDATE submissions
+        SET correctness_score=%s, syntax_score=%s, logic_score=%s, feedback=%s
+        WHERE id=%s
+    """, (
+        grading_result['correctness_score'],
+        grading_result['syntax_score'],
+        grading_result['logic_score'],
+        grading_result['feedback'],
+        submission_id
+    ))
+
+
+class GradingQueue:
+    """In-process pool that grades submissions off the request thread.
+
+    Jobs run inside their own application context (and so their own MySQL
+    connection). Job state is tracked in memory for the status endpoint;
+    other gunicorn workers fall back to the database: the stored scores, a
+    failed job's grading_error, or STATUS_TIMEOUT for a job that was lost.
+    """
+
+    def __init__(self, max_workers=ASYNC_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._next_job = 0
+
+    def _get_executor(self):
+        # Created lazily so the pool's threads start in the gunicorn worker, not the master
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='grading')
+            return self._executor
+
+    def _set_status(self, submission_id, status, job_id, new=False, **fields):
+        with self._lock:
+            job = self._jobs.get(submission_id)
+            # A resubmission reuses the submission row: only the newest job may update its state
+            if not new and job is not None and job['job'] != job_id:
+                return False
+            job = self._jobs.pop(submission_id, {})
+            if new:
+                # A new job starts clean, without the error of the previous one
+                job = {}
+            job.update(fields)
+            job['job'] = job_id
+            job['status'] = status
+            self._jobs[submission_id] = job
+            while len(self._jobs) > STATUS_HISTORY:
+                self._jobs.popitem(last=False)
+            return True
+
+    def submit(self, app, submission_id, activity_id, student_id, code):
+        """Enqueue a persisted submission for grading and return immediately."""
+        with self._lock:
+            self._next_job += 1
+            job_id = self._next_job
+        self._set_status(submission_id, QUEUED, job_id, new=True, activity_id=activity_id)
+        self._get_executor().submit(self._grade, app, submission_id, job_id, activity_id, student_id, code)
+
+    def _retry(self, app, submission_id, job_id, activity_id, student_id, code, attempt):
+        """Grade the job again after RETRY_DELAY, unless a newer job replaced it."""
+        if not self._set_status(submission_id, QUEUED, job_id, attempt=attempt):
+            return
+        timer = threading.Timer(RETRY_DELAY, lambda: self._get_executor().submit(
+            self._grade, app, submission_id, job_id, activity_id, student_id, code, attempt))
+        timer.daemon = True
+        timer.start()
+
+    def _grade(self, app, submission_id, job_id, activity_id, student_id, code, attempt=0):
+        from app.grading import grade_submission
+
+        self._set_status(submission_id, RUNNING, job_id)
+        with app.app_context():
+            try:
+                grading_result = grade_submission(activity_id, student_id, code)
+                if grading_result.get('retryable') and attempt < RETRY_ATTEMPTS:
+                    logger.warning(f"Grading of submission {submission_id} will be retried: {grading_result['error']}")
+                    self._retry(app, submission_id, job_id, activity_id, student_id, code, attempt + 1)
+                    return
+                if 'error' in grading_result:
+                    self._fail(submission_id, job_id, code, grading_result['error'])
+                    return
+
+                cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+                try:
+                    # Skip stale jobs: the student may have resubmitted meanwhile
+                    cur.execute("SELECT code FROM submissions WHERE id=%s", (submission_id,))
+                    row = cur.fetchone()
+                    if not row or row['code'] != code:
+                        self._set_status(submission_id, SUPERSEDED, job_id)
+                        return
+                    store_grading_result(cur, submission_id, grading_result)
+                    mysql.connection.commit()
+                finally:
+                    cur.close()
+
+                self._set_status(submission_id, DONE, job_id)
+            except Exception as e:
+                logger.error(f"Background grading failed for submission {submission_id}: {str(e)}")
+                try:
+                    mysql.connection.rollback()
+                except Exception:
+                    pass
+                self._fail(submission_id, job_id, code, str(e))
+
+    def _fail(self, submission_id, job_id, code, error):
+        """End the job as failed, here and in the database for the other workers."""
+        if not self._set_status(submission_id, FAILED, job_id, error=error):
+            return
+        try:
+            cur = mysql.connection.cursor()
+            try:
+                store_grading_error(cur, submission_id, code, error)
+                mysql.connection.commit()
+            finally:
+                cur.close()
+        except Exception as e:
+            logger.error(f"Could not record the grading error of submission {submission_id}: {str(e)}")
+
+    def status(self, submission_id):
+        """In-memory job state for a submission, or None if this worker never saw it."""
+        with self._lock:
+            job = self._jobs.get(submission_id)
+            if not job:
+                return None
+            return {key: value for key, value in job.items() if key != 'job'}
+
+
+# Shared per-worker queue
+grading_queue = GradingQueue()
@@ -0,0 +1,187 @@
+"""Stored grading results, reused for identical code under the same grading plan.
+
+A result is keyed by (activity id, grading-plan version, SHA-256 of the
+source, overdue penalty). Resubmitting byte-identical code, or grading it
+again while the activity is unchanged, returns the stored scores and
+feedback without compiling or running anything. Saving the activity
+bumps its plan version (app.grading_plan), so a change to the tests,
+weights, text or due date retires every stored result of the activity.
+
+The hash is taken over the source as graded. No further normalization
+is done, because the feedback quotes the code and the layout heuristics
+read its exact lines. Results that depended on load are never stored,
+for example a timeout or a run skipped over the time budget. Each entry
+also records the grader revision (RESULT_FORMAT, the gcc version and,
+with GRADING_ML_BLEND, the served ML models).
+
+Set GRADING_RESULT_STORE=0 to disable.
+"""
+import os
+import hashlib
+import datetime
+import threading
+import logging
+from app import mysql
+from app.compile_cache import gcc_version
+from app.grading_pipeline import submission_time, overdue_penalty
+from app import ml_models
+from app.schema import SchemaCheck, table_exists
+import MySQLdb
+
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_ENABLED = os.environ.get('GRADING_RESULT_STORE', '1') != '0'
+
+# Bump when grading logic changes the scores or feedback of unchanged code
+RESULT_FORMAT = 2
+
+SCORE_FIELDS = ('correctness_score', 'syntax_score', 'logic_score', 'requirement_score', 'total_score')
+
+
+def source_hash(code):
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+class GradingResultStore:
+    """The grading_results table, created by migrate_db.py (app.schema)."""
+
+    def __init__(self, enabled=RESULT_STORE_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._table = SchemaCheck('Grading result store', lambda cur: table_exists(cur, 'grading_results'))
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def grader(self):
+        """Revision of everything besides the plan that shapes a result."""
+        revision = f"{RESULT_FORMAT}:{gcc_version()}"
+        if ml_models.BLEND > 0:
+            # Blended scores change with the served model version
+            revision += f":{ml_models.ml_model_store.revision()}"
+        return revision
+
+    def ensure_table(self, cur):
+        return self._table.ready(cur)
+
+    def key(self, context, code, submitted_at):
+        """Store key for grading `code` under a grading context, or None if results are not stored."""
+        if not self.enabled or context.get('plan_version') is None:
+            return None
+        penalty = overdue_penalty(context['due_date'], submission_time(submitted_at))
+        return (context['activity_id'], context['plan_version'], source_hash(code), int(penalty))
+
+    def _result(self, row):
+        result = {name: row[name] for name in SCORE_FIELDS}
+        result['feedback'] = row['feedback']
+        result['execution_timings'] = {}
+        result['stored_result'] = True
+        return result
+
+    def lookup(self, key):
+        """The stored result for a key, or None."""
+        if key is None:
+            return None
+        cur = mysql.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
+        try:
+            if not self.ensure_table(cur):
+                return None
+            cur.execute("""
+                SELECT correctness_score, syntax_score, logic_score, requirement_score, total_score, feedback
+                FROM grading_results
+                WHERE activity_id = %s AND plan_version = %s AND code_sha256 = %s
+                  AND overdue_penalty = %s AND grader = %s
+            """, key + (self.grader(),))
+            row = cur.fetchone()
+        except Exception as e:
+            logger.error(f"Error reading stored grading result: {str(e)}")
+            row = None
+        finally:
+            cur.close()
+
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return self._result(row) if row else None
+
+    def load_activity(self, activity_id, plan_version):
+        """All results stored for a plan version, keyed like lookup(). Used by bulk regrades."""
+        if not self.enabled or plan_version is None:
+            return {}
+        cur = mysql.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
+        try:
+            if not self.ensure_table(cur):
+                return {}
+            cur.execute("""
+                SELECT code_sha256, overdue_penalty, correctness_score, syntax_score, logic_score,
+                       requirement_score, total_score, feedback
+                FROM grading_results
+                WHERE activity_id = %s AND plan_version = %s AND grader = %s
+            """, (activity_id, plan_version, self.grader()))
+            rows = cur.fetchall()
+        except Exception as e:
+            logger.error(f"Error reading stored grading results: {str(e)}")
+            rows = []
+        finally:
+            cur.close()
+        return {(activity_id, plan_version, row['code_sha256'], row['overdue_penalty']): self._result(row)
+                for row in rows}
+
+    def entry(self, key, result, session):
+        """Row to store for a fresh result, or None if it must not be reused."""
+        if key is None or 'error' in result or not session.reproducible:
+            return None
+        return key + (self.grader(),) + tuple(result[name] for name in SCORE_FIELDS) + (
+            result['feedback'], datetime.datetime.now())
+
+    def store(self, entries, cur=None):
+        """Insert entries from entry(). Older plan versions of the same activities are dropped."""
+        entries = [entry for entry in entries if entry]
+        if not entries:
+            return
+        own_cursor = cur is None
+        if own_cursor:
+            cur = mysql.connection.cursor()
+        try:
+            if not self.ensure_table(cur):
+                return
+            cur.executemany("""
+                INSERT INTO grading_results (
+                    activity_id, plan_version, code_sha256, overdue_penalty, grader,
+                    correctness_score, syntax_score, logic_score, requirement_score, total_score,
+                    feedback, created_at
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    grader = VALUES(grader), correctness_score = VALUES(correctness_score),
+                    syntax_score = VALUES(syntax_score), logic_score = VALUES(logic_score),
+                    requirement_score = VALUES(requirement_score), total_score = VALUES(total_score),
+                    feedback = VALUES(feedback), created_at = VALUES(created_at)
+            """, entries)
+            for activity_id, plan_version in {(entry[0], entry[1]) for entry in entries}:
+                cur.execute("DELETE FROM grading_results WHERE activity_id = %s AND plan_version < %s",
+                            (activity_id, plan_version))
+            if own_cursor:
+                mysql.connection.commit()
+            with self._lock:
+                self.stored += len(entries)
+        except Exception as e:
+            logger.error(f"Error storing grading results: {str(e)}")
+            if own_cursor:
+                try:
+                    mysql.connection.rollback()
+                except Exception:
+                    pass
+        finally:
+            if own_cursor:
+                cur.close()
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': self.enabled, 'hits': self.hits, 'misses': self.misses, 'stored': self.stored}
+
+
+# Shared per-worker result store
+grading_results = GradingResultStore()
@@ -0,0 +1,401 @@
+"""The trained grading models: a versioned registry, loaded on first use.
+
+Training publishes every model set as a new version in the registry
+directory (GRADING_ML_REGISTRY_DIR, default ml_models/):
+
+    v000007.joblib   the models, saved with joblib, uncompressed
+    v000007.json     training metadata (rows, report, time, format)
+    CURRENT          the version workers serve, e.g. "7"
+
+Both files are written under a temporary name and renamed into place
+before CURRENT is replaced, again by a rename. A worker never sees a
+half-written file. Workers read CURRENT at most once every
+GRADING_ML_CHECK_INTERVAL seconds (default 30). When it names another
+version, they load that version in a background thread and keep serving
+the old one until it is ready, so no restart is needed and no grade waits
+on a load. The newest GRADING_ML_KEEP_VERSIONS versions (default 5) are
+kept.
+
+No worker imports scikit-learn or numpy, or reads a model file, until
+the first ML prediction. Model files load with mmap_mode='r': numpy
+arrays are mapped from the page cache instead of being read into a
+buffer and copied. Without a registry, ml_grading_models.joblib or
+ml_grading_models.pkl (written with pickle by older versions) still
+load.
+
+scikit-learn copies tree nodes into memory it owns when a forest is
+loaded, so the trees are only shared between gunicorn workers when the
+master loads them before forking. Set GRADING_ML_PRELOAD=1 and run
+gunicorn with --preload to do that, at the cost of a slower boot.
+
+Load time, file size and the resident size the load added are logged
+and shown in /admin/grading/cache_stats.
+
+Two model formats exist. The default has one RandomForestRegressor per
+score ('correctness_model', 'logic_model', 'syntax_model'). The
+multi-output format ('grading_model' plus 'targets') is one forest fitted
+on the three scores together: a third of the trees to walk per
+prediction, and a smaller file. Set GRADING_ML_MULTI_OUTPUT=1 to train
+it. predict() serves either format.
+
+Training can also distill the forests into a compact student: a ridge
+regression ('linear') or shallow gradient-boosted trees ('boosted'),
+fitted to the forests' predictions and stored as 'distilled' in the same
+model file. The linear student has the scaler folded into its weights,
+so a prediction is one matrix product. GRADING_ML_BACKEND=distilled
+makes predict() serve the student when the served version has one; the
+default 'forest' serves the forests.
+
+Grades use the models only when GRADING_ML_BLEND is above 0: the
+'ml_scores' grading stage (app.grading_pipeline) predicts the three
+scores of a submission that compiles, and each criterion score becomes
+(1 - GRADING_ML_BLEND) * rule-based score + GRADING_ML_BLEND * prediction.
+With the default 0 the models are never loaded for grading.
+"""
+import os
+import json
+import time
+import pickle
+import datetime
+import re
+import threading
+import logging
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = os.environ.get('GRADING_ML_REGISTRY_DIR', 'ml_models')
+
+# Single model files from before the registry, the second one written with pickle
+MODEL_PATH = os.environ.get('GRADING_ML_MODELS', 'ml_grading_models.joblib')
+LEGACY_MODEL_PATH = 'ml_grading_models.pkl'
+
+try:
+    CHECK_INTERVAL = max(0.0, float(os.environ.get('GRADING_ML_CHECK_INTERVAL', 30)))
+except ValueError:
+    CHECK_INTERVAL = 30.0
+
+try:
+    KEEP_VERSIONS = max(1, int(os.environ.get('GRADING_ML_KEEP_VERSIONS', 5)))
+except ValueError:
+    KEEP_VERSIONS = 5
+
+_VERSION_FILE_RE = re.compile(r'^v(\d+)\.(joblib|json)$')
+
+# Set GRADING_ML_PRELOAD=1 to load the models at startup instead of on first use
+PRELOAD = os.environ.get('GRADING_ML_PRELOAD', '0') == '1'
+
+# Set GRADING_ML_MULTI_OUTPUT=1 to train one multi-output forest instead of three
+MULTI_OUTPUT = os.environ.get('GRADING_ML_MULTI_OUTPUT', '0') == '1'
+
+# Model predict() serves: 'forest' or 'distilled' (falls back to the forests without a student)
+BACKEND = os.environ.get('GRADING_ML_BACKEND', 'forest')
+
+# Share of each criterion score taken from the models' prediction, 0 to 1 (0: not used for grading)
+try:
+    BLEND = min(1.0, max(0.0, float(os.environ.get('GRADING_ML_BLEND', 0))))
+except ValueError:
+    BLEND = 0.0
+
+# Student model train() distills from the forests: 'linear', 'boosted' or 'none'
+DISTILL = os.environ.get('GRADING_ML_DISTILL', 'linear')
+
+# Predicted scores, in the column order of fit_models' targets and predict's result
+TARGETS = ('correctness', 'logic', 'syntax')
+
+N_ESTIMATORS = 100
+
+
+def resident_bytes():
+    """Current resident set size of this process, 0 where it cannot be read (Windows)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        # No /proc: the peak is the best available figure (kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fit_models(X, y, multi_output=MULTI_OUTPUT, n_jobs=None):
+    """Fit the scaler and the forests on feature rows X and score rows y (TARGETS order).
+
+    n_jobs parallelizes the fit only; the returned forests predict single-threaded,
+    which is faster for the one or few rows of a grade.
+    """
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    X = np.asarray(X)
+    y = np.asarray(y)
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    if multi_output:
+        grading_model = RandomForestRegressor(n_estimators=N_ESTIMATORS, random_state=42, n_jobs=n_jobs)
+        grading_model.fit(X_scaled, y)
+        grading_model.set_params(n_jobs=None)
+        return {'grading_model': grading_model, 'targets': TARGETS, 'scaler': scaler}
+
+    models = {'scaler': scaler}
+    for column, target in enumerate(TARGETS):
+        model = RandomForestRegressor(n_estimators=N_ESTIMATORS, random_state=42, n_jobs=n_jobs)
+        model.fit(X_scaled, y[:, column])
+        model.set_params(n_jobs=None)
+        models[f"{target}_model"] = model
+    return models
+
+
+def distill(models, X, kind=DISTILL):
+    """A compact student fitted to the forests' predictions on feature rows X."""
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    scaler = models['scaler']
+    X_scaled = scaler.transform(X)
+    teacher = predict(models, X, backend='forest')
+
+    if kind == 'linear':
+        from sklearn.linear_model import Ridge
+        ridge = Ridge(alpha=1.0).fit(X_scaled, teacher)
+        # Fold the scaling in: (x - mean) / scale @ coef.T + b == x @ weights + bias
+        scale = np.where(scaler.scale_ == 0, 1.0, scaler.scale_)
+        weights = ridge.coef_.T / scale[:, None]
+        bias = ridge.intercept_ - (scaler.mean_ / scale) @ ridge.coef_.T
+        return {'kind': 'linear', 'weights': weights, 'bias': bias}
+
+    if kind == 'boosted':
+        from sklearn.ensemble import GradientBoostingRegressor
+        return {'kind': 'boosted', 'models': [
+            GradientBoostingRegressor(n_estimators=N_ESTIMATORS, max_depth=2, random_state=42).fit(X_scaled, teacher[:, column])
+            for column in range(len(TARGETS))
+        ]}
+
+    raise ValueError(f"Unknown distilled model kind: {kind}")
+
+
+def predict(models, feature_vectors, backend=None):
+    """Predicted scores of feature rows: an (n, 3) array in TARGETS order.
+
+    backend is 'forest' or 'distilled' (default: GRADING_ML_BACKEND).
+    """
+    import numpy as np
+
+    student = models.get('distilled') if (backend or BACKEND) == 'distilled' else None
+    if student and student['kind'] == 'linear':
+        return np.asarray(feature_vectors, dtype=np.float64) @ student['weights'] + student['bias']
+
+    X_scaled = models['scaler'].transform(feature_vectors)
+    if student:
+        return np.column_stack([model.predict(X_scaled) for model in student['models']])
+    if 'grading_model' in models:
+        predictions = models['grading_model'].predict(X_scaled)
+        return predictions[:, [list(models['targets']).index(target) for target in TARGETS]]
+    return np.column_stack([models[f"{target}_model"].predict(X_scaled) for target in TARGETS])
+
+
+class ModelStore:
+    """The model registry, and the version this worker serves."""
+
+    def __init__(self, registry_dir=REGISTRY_DIR, legacy_paths=(MODEL_PATH, LEGACY_MODEL_PATH),
+                 check_interval=CHECK_INTERVAL, keep_versions=KEEP_VERSIONS):
+        self.registry_dir = registry_dir
+        self.legacy_paths = legacy_paths
+        self.check_interval = check_interval
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._models = None
+        self._loaded = False
+        self._next_check = 0.0
+        self._reloading = False
+        self.version = None
+        self.info = {}
+
+    def _path(self, version, extension):
+        return os.path.join(self.registry_dir, f"v{version:06d}.{extension}")
+
+    def current_version(self):
+        """The version CURRENT points at, or None without a registry."""
+        try:
+            with open(os.path.join(self.registry_dir, 'CURRENT')) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def versions(self):
+        """Published versions, oldest first."""
+        try:
+            names = os.listdir(self.registry_dir)
+        except OSError:
+            return []
+        return sorted({int(match.group(1)) for match in map(_VERSION_FILE_RE.match, names)
+                       if match and match.group(2) == 'joblib'})
+
+    def metadata(self, version):
+        try:
+            with open(self._path(version, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self):
+        """The models dict, or None if there is no usable model file."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    version = self.current_version()
+                    models, info = self._load(version)
+                    self._install(version, models, info)
+                    self._loaded = True
+                    self._next_check = time.monotonic() + self.check_interval
+        elif time.monotonic() >= self._next_check:
+            self._check()
+        return self._models
+
+    def _check(self):
+        """Start loading the version CURRENT points at, if this worker serves another one."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_check or self._reloading:
+                return
+            self._next_check = now + self.check_interval
+            version = self.current_version()
+            if version is None or version == self.version:
+                return
+            self._reloading = True
+        # The old models keep serving until the new ones are loaded
+        threading.Thread(target=self._reload, args=(version,), daemon=True).start()
+
+    def _reload(self, version):
+        try:
+            models, info = self._load(version)
+            if models is not None:
+                with self._lock:
+                    self._install(version, models, info)
+        finally:
+            self._reloading = False
+
+    def _install(self, version, models, info):
+        self._models = models
+        self.version = version if models is not None else None
+        self.info = info
+
+    def _load(self, version):
+        """(models, info) of a registry version, or of a legacy file for version None."""
+        if version is not None:
+            path, mmap = self._path(version, 'joblib'), True
+        else:
+            candidates = [path for path in self.legacy_paths if path and os.path.exists(path)]
+            if not candidates:
+                return None, {}
+            path = candidates[0]
+            mmap = not path.endswith('.pkl')
+
+        rss_before = resident_bytes()
+        start = time.perf_counter()
+        try:
+            if mmap:
+                import joblib
+                models = joblib.load(path, mmap_mode='r')
+            else:
+                with open(path, 'rb') as f:
+                    models = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Error loading ML models from {path}: {str(e)}")
+            return None, {}
+
+        info = {
+            'version': version,
+            'path': path,
+            'format': 'joblib (mmap)' if mmap else 'pickle',
+            'file_mb': round(os.path.getsize(path) / (1024 * 1024), 2),
+            'load_ms': round((time.perf_counter() - start) * 1000, 1),
+            # Includes importing scikit-learn and numpy if this is their first use
+            'rss_added_mb': round((resident_bytes() - rss_before) / (1024 * 1024), 1),
+            'multi_output': 'grading_model' in models,
+            'distilled': models['distilled']['kind'] if models.get('distilled') else None,
+            'backend': 'distilled' if BACKEND == 'distilled' and models.get('distilled') else 'forest',
+            'metadata': self.metadata(version) if version is not None else {},
+        }
+        logger.info(f"ML models loaded from {path} in {info['load_ms']}ms, "
+                    f"resident size +{info['rss_added_mb']}MB")
+        return models, info
+
+    def publish(self, models, metadata=None):
+        """Store models as a new version with its metadata and point CURRENT at it. Returns the version."""
+        import joblib
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+        # Claim the next free version; O_EXCL keeps two trainers from taking the same one
+        version = (self.versions() or [0])[-1] + 1
+        while True:
+            try:
+                os.close(os.open(self._path(version, 'joblib'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                version += 1
+
+        tmp_suffix = f".tmp{os.getpid()}"
+        try:
+            # Uncompressed, otherwise the arrays cannot be memory-mapped
+            joblib.dump(models, self._path(version, 'joblib') + tmp_suffix)
+            os.replace(self._path(version, 'joblib') + tmp_suffix, self._path(version, 'joblib'))
+
+            metadata = dict(metadata or {}, version=version,
+                            published_at=datetime.datetime.now().isoformat(timespec='seconds'),
+                            multi_output='grading_model' in models)
+            with open(self._path(version, 'json') + tmp_suffix, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+            os.replace(self._path(version, 'json') + tmp_suffix, self._path(version, 'json'))
+        except Exception:
+            # Leave no empty or partial version behind
+            for path in (self._path(version, 'joblib'), self._path(version, 'joblib') + tmp_suffix,
+                         self._path(version, 'json') + tmp_suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        self.activate(version)
+        self._prune(version)
+        return version
+
+    def activate(self, version):
+        """Point CURRENT at a published version (also used to roll back)."""
+        if not os.path.exists(self._path(version, 'joblib')):
+            raise ValueError(f"No published ML models version {version}")
+        pointer = os.path.join(self.registry_dir, 'CURRENT')
+        with open(pointer + f".tmp{os.getpid()}", 'w') as f:
+            f.write(f"{version}\n")
+        os.replace(pointer + f".tmp{os.getpid()}", pointer)
+        # Pick it up on this worker's next prediction
+        self._next_check = 0.0
+
+    def _prune(self, current):
+        for version in self.versions()[:-self.keep_versions]:
+            if version == current:
+                continue
+            for extension in ('joblib', 'json'):
+                try:
+                    os.remove(self._path(version, extension))
+                except OSError:
+                    pass
+
+    def revision(self):
+        """What a blended grade depends on besides the code: the served version, the share and the backend."""
+        self.get()
+        return f"ml{self.version}:{BLEND}:{self.info.get('backend')}"
+
+    def stats(self):
+        return dict(self.info, loaded=self._models is not None, current_version=self.current_version(),
+                    reloading=self._reloading, blend=BLEND)
+
+
+# Shared per-worker model store
+ml_model_store = ModelStore()
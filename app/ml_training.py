@@ -0,0 +1,320 @@
+"""Training the grading models: streamed data, k-fold evaluation and a publish gate.
+
+Every graded submission is used, not only the newest ones. Rows come
+from a server-side cursor (SSDictCursor) and are read in chunks of
+GRADING_ML_CHUNK_SIZE, so no more than one chunk of source code is held
+in memory. Each chunk's features are written into a feature matrix
+that is preallocated from a row count.
+
+Set GRADING_ML_FEATURE_WORKERS to extract features in that many worker
+processes while the next chunks are read. The workers are spawned, not
+forked, so they never inherit the open MySQL connection.
+
+train() runs the whole training pass:
+- It fits with n_jobs (GRADING_ML_N_JOBS, default all cores).
+- It evaluates with k-fold cross-validation (GRADING_ML_FOLDS, default
+  5), giving the MAE per target.
+- It records fit time, predict latency per sample and model size.
+- Unless distill_kind is 'none', it distills the forests into a compact
+  student (see app.ml_models.distill) that is stored with them. The
+  student is evaluated on the same folds: its MAE, the accuracy lost
+  against the forests, and its latency.
+- It compares the result with the evaluation stored in the metadata of
+  the version being served. The new models are not published if their
+  mean MAE is more than GRADING_ML_MAX_MAE_INCREASE (default 0.05, i.e.
+  5%) higher, or their latency more than
+  GRADING_ML_MAX_LATENCY_INCREASE (default 0.25) higher. The served
+  version was evaluated on the data of its own training run, so the
+  comparison is a guard against regressions, not a paired test. With
+  GRADING_ML_BACKEND=distilled the student's figures are compared.
+"""
+import os
+import time
+import tempfile
+import logging
+from collections import deque
+from app import mysql
+from app.code_features import feature_matrix, FEATURE_NAMES
+from app.ml_models import TARGETS, MULTI_OUTPUT, DISTILL, BACKEND, fit_models, distill, predict, ml_model_store
+import MySQLdb
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    CHUNK_SIZE = max(1, int(os.environ.get('GRADING_ML_CHUNK_SIZE', 500)))
+except ValueError:
+    CHUNK_SIZE = 500
+
+try:
+    FEATURE_WORKERS = max(0, int(os.environ.get('GRADING_ML_FEATURE_WORKERS', 0)))
+except ValueError:
+    FEATURE_WORKERS = 0
+
+try:
+    N_JOBS = int(os.environ.get('GRADING_ML_N_JOBS', -1))
+except ValueError:
+    N_JOBS = -1
+
+try:
+    FOLDS = max(2, int(os.environ.get('GRADING_ML_FOLDS', 5)))
+except ValueError:
+    FOLDS = 5
+
+try:
+    MAX_MAE_INCREASE = float(os.environ.get('GRADING_ML_MAX_MAE_INCREASE', 0.05))
+except ValueError:
+    MAX_MAE_INCREASE = 0.05
+
+try:
+    MAX_LATENCY_INCREASE = float(os.environ.get('GRADING_ML_MAX_LATENCY_INCREASE', 0.25))
+except ValueError:
+    MAX_LATENCY_INCREASE = 0.25
+
+# Fewer graded submissions than this are not enough to train on
+MIN_TRAINING_ROWS = 50
+
+# Rows timed one at a time for the predict latency
+LATENCY_SAMPLES = 200
+
+TRAINING_ROWS = """
+    FROM submissions
+    WHERE code IS NOT NULL
+    AND LENGTH(code) > 20
+    AND correctness_score IS NOT NULL
+    AND syntax_score IS NOT NULL
+    AND logic_score IS NOT NULL
+"""
+
+
+def chunk_features(codes):
+    """Feature matrix (app.code_features.feature_matrix) of a chunk of sources."""
+    return feature_matrix(codes)
+
+
+def feature_names():
+    return list(FEATURE_NAMES)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_training_data(chunk_size=CHUNK_SIZE, workers=FEATURE_WORKERS, max_rows=None):
+    """Features and scores of the graded submissions, newest first.
+
+    Returns (X, y, names, report): X is an (n, features) array, y an (n, 3)
+    array in TARGETS order, and report holds the row count, rows per second
+    and the peak RSS of this process.
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+    cur = mysql.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
+    try:
+        cur.execute(f"SELECT COUNT(*) AS total {TRAINING_ROWS}")
+        total = cur.fetchone()['total']
+    finally:
+        cur.close()
+    if max_rows:
+        total = min(total, max_rows)
+
+    names = feature_names()
+    X = np.empty((total, len(names)), dtype=np.float64)
+    y = np.empty((total, len(TARGETS)), dtype=np.float64)
+
+    pool = None
+    if workers > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    pending = deque()
+
+    def collect(limit):
+        while len(pending) > limit:
+            offset, future = pending.popleft()
+            rows = future.result()
+            X[offset:offset + len(rows)] = rows
+
+    rows = 0
+    # The LIMIT keeps rows inserted after the count out of the preallocated arrays
+    cur = mysql.connection.cursor(cursorclass=MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(f"""
+            SELECT code, correctness_score, logic_score, syntax_score
+            {TRAINING_ROWS}
+            ORDER BY submitted_at DESC
+            LIMIT %s
+        """, (total,))
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            codes = [row['code'] for row in chunk]
+            y[rows:rows + len(chunk)] = [[row[f"{target}_score"] for target in TARGETS] for row in chunk]
+            if pool:
+                pending.append((rows, pool.submit(chunk_features, codes)))
+                # Bound the chunks in flight so memory stays flat
+                collect(2 * workers)
+            else:
+                X[rows:rows + len(chunk)] = chunk_features(codes)
+            rows += len(chunk)
+        collect(0)
+    finally:
+        cur.close()
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'rows': rows,
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else None,
+        'chunk_size': chunk_size,
+        'workers': workers if pool else 1,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    logger.info(f"Training data: {rows} submissions in {report['seconds']}s "
+                f"({report['rows_per_sec']} rows/s), peak RSS {report['peak_rss_mb']}MB")
+    # Rows deleted after the count leave the end unused
+    return X[:rows], y[:rows], names, report
+
+
+def _mae(errors):
+    import numpy as np
+
+    mae = np.mean(errors, axis=0)
+    return {target: round(float(value), 3) for target, value in zip(TARGETS, mae)}, round(float(mae.mean()), 3)
+
+
+def evaluate_models(X, y, multi_output=MULTI_OUTPUT, n_jobs=N_JOBS, folds=FOLDS, distill_kind=DISTILL):
+    """Mean absolute error per target over k shuffled folds, of the forests and of their distilled student."""
+    import numpy as np
+    from sklearn.model_selection import KFold
+
+    errors, student_errors, fidelity = [], [], []
+    for train_index, test_index in KFold(n_splits=folds, shuffle=True, random_state=42).split(X):
+        models = fit_models(X[train_index], y[train_index], multi_output=multi_output, n_jobs=n_jobs)
+        forest_predictions = predict(models, X[test_index], backend='forest')
+        errors.append(np.abs(forest_predictions - y[test_index]).mean(axis=0))
+        if distill_kind != 'none':
+            models['distilled'] = distill(models, X[train_index], distill_kind)
+            student_predictions = predict(models, X[test_index], backend='distilled')
+            student_errors.append(np.abs(student_predictions - y[test_index]).mean(axis=0))
+            fidelity.append(np.abs(student_predictions - forest_predictions).mean(axis=0))
+
+    mae, mae_mean = _mae(errors)
+    evaluation = {'folds': folds, 'mae': mae, 'mae_mean': mae_mean}
+    if student_errors:
+        student_mae, student_mae_mean = _mae(student_errors)
+        evaluation['distilled'] = {
+            'kind': distill_kind,
+            'mae': student_mae,
+            'mae_mean': student_mae_mean,
+            # Held-out MAE the student adds over the forests
+            'accuracy_loss': round(student_mae_mean - mae_mean, 3),
+            # Held-out mean distance between student and forest predictions
+            'fidelity_mae': _mae(fidelity)[1],
+        }
+    return evaluation
+
+
+def predict_latency(models, X, backend='forest', samples=LATENCY_SAMPLES):
+    """Predict latency per sample, one row at a time as grading does."""
+    latencies = []
+    for row in X[:samples]:
+        start = time.perf_counter()
+        predict(models, [row], backend=backend)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'predict_ms_per_sample': round(latencies[len(latencies) // 2], 3),
+        'predict_ms_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+    }
+
+
+def model_size_mb(models):
+    import joblib
+
+    with tempfile.NamedTemporaryFile(suffix='.joblib') as f:
+        joblib.dump(models, f.name)
+        return round(os.path.getsize(f.name) / (1024 * 1024), 2)
+
+
+def served_metrics(evaluation):
+    """The part of an evaluation that describes the backend workers serve (GRADING_ML_BACKEND)."""
+    if BACKEND == 'distilled' and evaluation.get('distilled', {}).get('predict_ms_per_sample') is not None:
+        return evaluation['distilled']
+    return evaluation
+
+
+def publish_check(evaluation, current, max_mae_increase=MAX_MAE_INCREASE,
+                  max_latency_increase=MAX_LATENCY_INCREASE):
+    """Reasons not to replace the served models (their metadata) with newly evaluated ones."""
+    reasons = []
+    previous = (current or {}).get('evaluation')
+    if not previous:
+        return reasons
+    evaluation, previous = served_metrics(evaluation), served_metrics(previous)
+    if evaluation['mae_mean'] > previous['mae_mean'] * (1 + max_mae_increase):
+        reasons.append(f"mean MAE {evaluation['mae_mean']} vs {previous['mae_mean']} "
+                       f"(allowed +{max_mae_increase:.0%})")
+    if evaluation['predict_ms_per_sample'] > previous['predict_ms_per_sample'] * (1 + max_latency_increase):
+        reasons.append(f"predict latency {evaluation['predict_ms_per_sample']}ms vs "
+                       f"{previous['predict_ms_per_sample']}ms (allowed +{max_latency_increase:.0%})")
+    return reasons
+
+
+def train(multi_output=MULTI_OUTPUT, n_jobs=N_JOBS, folds=FOLDS, distill_kind=DISTILL,
+          max_mae_increase=MAX_MAE_INCREASE, max_latency_increase=MAX_LATENCY_INCREASE,
+          force=False, dry_run=False, store=ml_model_store):
+    """Train, evaluate and (unless refused) publish the grading models. Returns the report."""
+    X, y, names, data_report = load_training_data()
+    report = {'data': data_report, 'published': False, 'version': None, 'refused': []}
+    if data_report['rows'] < MIN_TRAINING_ROWS:
+        report['refused'] = [f"{data_report['rows']} graded submissions, need at least {MIN_TRAINING_ROWS}"]
+        return report
+
+    start = time.perf_counter()
+    evaluation = evaluate_models(X, y, multi_output=multi_output, n_jobs=n_jobs, folds=folds,
+                                 distill_kind=distill_kind)
+    evaluation['evaluate_seconds'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    models = fit_models(X, y, multi_output=multi_output, n_jobs=n_jobs)
+    evaluation['fit_seconds'] = round(time.perf_counter() - start, 2)
+    evaluation.update(predict_latency(models, X))
+    if distill_kind != 'none':
+        models['distilled'] = distill(models, X, distill_kind)
+        evaluation['distilled'].update(predict_latency(models, X, backend='distilled'))
+    evaluation['model_mb'] = model_size_mb(models)
+    evaluation.update({'multi_output': multi_output, 'n_jobs': n_jobs})
+    report['evaluation'] = evaluation
+
+    current_version = store.current_version()
+    current = store.metadata(current_version) if current_version is not None else None
+    report['current'] = {'version': current_version, 'evaluation': (current or {}).get('evaluation')}
+    report['refused'] = publish_check(evaluation, current, max_mae_increase, max_latency_increase)
+    if dry_run or (report['refused'] and not force):
+        return report
+
+    models['feature_names'] = names
+    report['version'] = store.publish(models, {
+        'feature_names': names,
+        'training_samples': data_report['rows'],
+        'training_report': data_report,
+        'evaluation': evaluation,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+    report['published'] = True
+    logger.info(f"ML models version {report['version']} published: mean MAE {evaluation['mae_mean']}, "
+                f"{evaluation['predict_ms_per_sample']}ms per sample, {evaluation['model_mb']}MB")
+    return report
@@ -0,0 +1,247 @@
+"""Precompiled headers for the standard C preludes of student submissions.
+
+Most submissions start with the same few `#include <...>` lines, and parsing
+those headers is a large share of every gcc run. For each configured prelude
+(a set of system headers) a `.gch` is built once per gcc version and flag
+set. A submission whose include set is exactly one of the preludes is
+compiled with `-include <prelude>.h`, so gcc loads the precompiled state and
+the submission's own includes become no-ops behind their include guards.
+Anything else (another include set, a quoted include, a directive before
+the includes, an #include further down) compiles normally, so diagnostics
+such as a missing-header warning never change.
+
+With a prelude, gcc reports the system headers as included from the
+prelude (`In file included from /tmp/.../prelude-<hash>.h:1`). run_gcc
+passes its diagnostics through prelude_diagnostics, which puts back the
+student's file and the line of the same #include. The only remaining
+difference is in the include chain of a header that two of the student's
+headers share, when the student includes them in another order than the
+prelude.
+"""
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import subprocess
+import logging
+from app.compile_cache import gcc_version
+
+
+logger = logging.getLogger(__name__)
+
+# Preludes are separated by ';', headers within a prelude by ','
+DEFAULT_PRELUDES = (
+    'stdio.h;'
+    'stdio.h,stdlib.h;'
+    'stdio.h,string.h;'
+    'stdio.h,math.h;'
+    'stdio.h,stdlib.h,string.h;'
+    'stdio.h,stdlib.h,math.h;'
+    'stdio.h,stdlib.h,string.h,math.h'
+)
+DEFAULT_PCH_DIR = os.path.join(tempfile.gettempdir(), 'c_insight_pch')
+
+# Set GRADING_PCH=0 to always compile without precompiled headers
+PCH_ENABLED = os.environ.get('GRADING_PCH', '1') != '0'
+
+# Flags that do not change the precompiled state and are not passed to the .gch build
+_IGNORED_FLAGS = {'-fsyntax-only'}
+
+_INCLUDE_RE = re.compile(r'#\s*include\s*<([^<>]+)>\s*(//.*|/\*.*?\*/\s*)?$')
+_ANY_INCLUDE_RE = re.compile(r'^\s*#\s*include\b', re.MULTILINE)
+
+
+def parse_preludes(spec):
+    """Parse 'a.h,b.h;c.h' into a list of header tuples."""
+    preludes = []
+    for group in spec.split(';'):
+        headers = tuple(h.strip() for h in group.split(',') if h.strip())
+        if headers:
+            preludes.append(headers)
+    return preludes
+
+
+def leading_includes(code):
+    """System headers included at the top of `code`.
+
+    Returns None unless the file starts with nothing but `#include <...>`
+    lines (plus blank lines and comments) and has no other #include later
+    on, i.e. unless a prelude could stand in for its includes exactly.
+    """
+    included = _leading_include_lines(code)
+    return [header for header, _ in included] if included else None
+
+
+def _leading_include_lines(code):
+    """(header, line number) of each leading include, or None (see leading_includes)."""
+    headers = []
+    lines = code.split('\n')
+    in_comment = False
+    body_start = len(lines)
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if in_comment:
+            if '*/' not in stripped:
+                continue
+            in_comment = False
+            stripped = stripped.split('*/', 1)[1].strip()
+        if stripped.startswith('/*'):
+            if '*/' not in stripped:
+                in_comment = True
+                continue
+            stripped = stripped.split('*/', 1)[1].strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+
+        match = _INCLUDE_RE.match(stripped)
+        if not match:
+            body_start = index
+            break
+        headers.append((match.group(1).strip(), index + 1))
+
+    if not headers or _ANY_INCLUDE_RE.search('\n'.join(lines[body_start:])):
+        return None
+    return headers
+
+
+def prelude_diagnostics(stderr, prelude_path, code, source_name):
+    """gcc diagnostics of a compile with `-include prelude_path`, as they read without it.
+
+    Every `prelude-<hash>.h:N` becomes `source_name:L`, where L is the line
+    of `code` that includes the prelude's Nth header.
+    """
+    if prelude_path not in stderr:
+        return stderr
+    source_lines = dict(_leading_include_lines(code) or ())
+    try:
+        with open(prelude_path) as f:
+            prelude_headers = [match.group(1).strip() for match in map(_INCLUDE_RE.match, f.read().split('\n')) if match]
+    except OSError:
+        prelude_headers = []
+
+    def source_line(match):
+        index = int(match.group(1)) - 1
+        header = prelude_headers[index] if 0 <= index < len(prelude_headers) else None
+        return f"{source_name}:{source_lines.get(header, 1)}"
+
+    stderr = re.sub(re.escape(prelude_path) + r':(\d+)', source_line, stderr)
+    return stderr.replace(prelude_path, source_name)
+
+
+class PrecompiledHeaders:
+    """Builds and selects `.gch` files for the configured preludes.
+
+    Builds are written to a temp file and renamed into place, so gunicorn
+    workers building the same prelude concurrently never see a partial file.
+    """
+
+    def __init__(self, pch_dir=None, preludes=None, enabled=PCH_ENABLED):
+        self.pch_dir = pch_dir or os.environ.get('GRADING_PCH_DIR', DEFAULT_PCH_DIR)
+        if preludes is None:
+            preludes = parse_preludes(os.environ.get('GRADING_PCH_PRELUDES', DEFAULT_PRELUDES))
+        self.preludes = {frozenset(headers): headers for headers in preludes}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._ready = set()
+        self._failed = set()
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _build_flags(self, flags):
+        return [flag for flag in flags if flag not in _IGNORED_FLAGS]
+
+    def _header_path(self, headers, flags):
+        version = gcc_version()
+        if version is None:
+            return None
+        flag_key = hashlib.sha256('\0'.join([version] + self._build_flags(flags)).encode('utf-8'))
+        name = hashlib.sha256(','.join(headers).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.pch_dir, flag_key.hexdigest()[:16], f"prelude-{name}.h")
+
+    def _ensure(self, headers, flags):
+        """Path of the prelude header with an up to date .gch next to it, or None."""
+        path = self._header_path(headers, flags)
+        if path is None or path in self._failed:
+            return None
+        if path in self._ready:
+            return path
+
+        with self._lock:
+            if path in self._ready:
+                return path
+            if os.path.exists(path) and os.path.exists(path + '.gch'):
+                self._ready.add(path)
+                return path
+            try:
+                self._build(path, headers, flags)
+                self._ready.add(path)
+                return path
+            except (OSError, subprocess.SubprocessError, RuntimeError) as e:
+                logger.error(f"Precompiled header build failed for {', '.join(headers)}: {str(e)}")
+                self._failed.add(path)
+                return None
+
+    def _build(self, path, headers, flags):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        text = ''.join(f"#include <{header}>\n" for header in headers)
+
+        # The header goes in place first (gcc records its path in the .gch);
+        # without a .gch next to it, it is simply parsed as text
+        fd, tmp_header = tempfile.mkstemp(dir=directory, suffix='.h')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_header, path)
+
+        fd, tmp_gch = tempfile.mkstemp(dir=directory, suffix='.gch')
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                ['gcc', '-x', 'c-header'] + self._build_flags(flags) + [path, '-o', tmp_gch],
+                capture_output=True, text=True, timeout=60
+            )
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip()[:200])
+            os.replace(tmp_gch, path + '.gch')
+        finally:
+            if os.path.exists(tmp_gch):
+                os.unlink(tmp_gch)
+
+    def build(self, flags):
+        """Build the .gch of every prelude for `flags`. Returns how many are ready."""
+        if not self.enabled:
+            return 0
+        return sum(1 for headers in self.preludes.values() if self._ensure(headers, flags))
+
+    def include_flags(self, code, flags):
+        """Extra gcc arguments to compile `code` with `flags` against a prelude.
+
+        Empty when no prelude matches the code's include set exactly. With
+        a match the compile is faster, and run_gcc rewrites the prelude out
+        of the diagnostics (see prelude_diagnostics).
+        """
+        if not self.enabled:
+            return []
+        headers = leading_includes(code)
+        prelude = self.preludes.get(frozenset(headers)) if headers else None
+        path = self._ensure(prelude, flags) if prelude else None
+        if path is None:
+            self.fallbacks += 1
+            return []
+        self.hits += 1
+        return ['-include', path]
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'preludes': len(self.preludes),
+            'built': len(self._ready),
+            'failed': len(self._failed),
+            'hits': self.hits,
+            'fallbacks': self.fallbacks
+        }
+
+
+# Shared instance used by the grader
+precompiled_headers = PrecompiledHeaders()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app import mysql
+from app.grading_queue import QUEUED, RUNNING, DONE, FAILED
+from app.grading_results import grading_results
+from app.sandbox import SandboxBusy
+from app.grading_metrics import grading_metrics, grading_timings
+import MySQLdb
+
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+# Submissions graded concurrently by a regrade, and scores written per UPDATE batch
+REGRADE_WORKERS = _env_int('GRADING_REGRADE_WORKERS', os.cpu_count() or 1)
+REGRADE_BATCH_SIZE = _env_int('GRADING_REGRADE_BATCH_SIZE', 50)
+
+
+class RegradeManager:
+    """Regrades every submission of an activity in the background.
+
+    The activity is read once, then submissions are graded in parallel
+    with the DB-free grading core. Each session reuses the stored results
+    of test inputs its (cached) executable already ran, so after tests are
+    only added or edited, just the new inputs execute. Code that already
+    has a stored result under the current plan (app.grading_results) is
+    not graded again, and new results are stored. Scores are written
+    in batched UPDATEs that skip submissions resubmitted meanwhile.
+
+    One job per activity: a regrade requested while one is running
+    (e.g. the tests were edited again) restarts it once it finishes.
+    Progress is kept in memory for the worker that runs the job.
+    """
+
+    def __init__(self, max_workers=REGRADE_WORKERS, batch_size=REGRADE_BATCH_SIZE):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def start(self, app, activity_id):
+        """Start (or schedule a rerun of) the regrade of an activity. Returns its status."""
+        with self._lock:
+            job = self._jobs.get(activity_id)
+            if job and job['status'] in (QUEUED, RUNNING):
+                job['rerun'] = True
+                return dict(job)
+            job = self._jobs[activity_id] = self._new_job(activity_id)
+            snapshot = dict(job)
+
+        threading.Thread(target=self._run, args=(app, activity_id),
+                         name=f'regrade-{activity_id}', daemon=True).start()
+        return snapshot
+
+    def status(self, activity_id):
+        """Progress of the activity's latest regrade in this worker, or None."""
+        with self._lock:
+            job = self._jobs.get(activity_id)
+            return dict(job) if job else None
+
+    def _new_job(self, activity_id):
+        return {
+            'activity_id': activity_id,
+            'status': QUEUED,
+            'total': 0,
+            'graded': 0,
+            'failed': 0,
+            'written': 0,
+            'stored_results': 0,
+            'executed_runs': 0,
+            'reused_runs': 0,
+            'rerun': False,
+            'started_at': time.time(),
+            'finished_at': None
+        }
+
+    def _update(self, activity_id, **fields):
+        with self._lock:
+            self._jobs[activity_id].update(fields)
+
+    def _add(self, activity_id, **counts):
+        with self._lock:
+            job = self._jobs[activity_id]
+            for name, count in counts.items():
+                job[name] += count
+
+    def _run(self, app, activity_id):
+        with app.app_context():
+            while True:
+                try:
+                    self._regrade(activity_id)
+                except Exception as e:
+                    logger.error(f"Regrade of activity {activity_id} failed: {str(e)}")
+                    try:
+                        mysql.connection.rollback()
+                    except Exception:
+                        pass
+                    self._update(activity_id, status=FAILED, error=str(e), finished_at=time.time())
+                    return
+
+                with self._lock:
+                    job = self._jobs[activity_id]
+                    if not job['rerun']:
+                        job['status'] = DONE
+                        job['finished_at'] = time.time()
+                        logger.info(f"Regraded activity {activity_id}: {job['graded']} submissions, "
+                                    f"{job['executed_runs']} test runs executed, {job['reused_runs']} reused, "
+                                    f"{job['finished_at'] - job['started_at']:.1f}s")
+                        return
+                    self._jobs[activity_id] = self._new_job(activity_id)
+
+    def _regrade(self, activity_id):
+        from app.grading import code_grader
+
+        context = code_grader.load_grading_context(activity_id)
+        if context is None:
+            raise ValueError('Activity not found')
+
+        cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cur.execute("SELECT id, code, submitted_at FROM submissions WHERE activity_id=%s", (activity_id,))
+            submissions = cur.fetchall()
+        finally:
+            cur.close()
+
+        # Results already stored for this plan version: identical code is not graded again
+        stored = grading_results.load_activity(activity_id, context['plan_version'])
+
+        self._update(activity_id, status=RUNNING, total=len(submissions))
+
+        batch = []
+        entries = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='regrade') as pool:
+            futures = {pool.submit(self._grade_one, code_grader, context, row, stored): row for row in submissions}
+            for future in as_completed(futures):
+                row = futures[future]
+                grading_result, failed, timings, entry = future.result()
+                if grading_result is None:
+                    # Not graded (no sandbox runner was free, or grading failed): the stored grade stays
+                    self._add(activity_id, graded=1, failed=1)
+                    continue
+                batch.append((
+                    grading_result['correctness_score'],
+                    grading_result['syntax_score'],
+                    grading_result['logic_score'],
+                    grading_result['feedback'],
+                    json.dumps(grading_result['grading_timings']) if 'grading_timings' in grading_result else None,
+                    row['id'],
+                    row['code']
+                ))
+                if entry:
+                    entries.append(entry)
+                self._add(activity_id, graded=1, failed=int(failed),
+                          stored_results=int(bool(grading_result.get('stored_result'))),
+                          executed_runs=len(timings.get('runs', [])),
+                          reused_runs=timings.get('reused_runs', 0))
+                if len(batch) >= self.batch_size:
+                    self._write(activity_id, batch, entries)
+                    batch, entries = [], []
+        self._write(activity_id, batch, entries)
+
+    def _grade_one(self, code_grader, context, row, stored):
+        """Grade one stored submission. Runs on a pool thread without DB access.
+
+        Returns (result, failed, execution timings, result store entry or None).
+        The result is None when the runs could not start for lack of sandbox
+        runners or grading raised, so a failure never replaces a stored grade.
+        """
+        result_key = grading_results.key(context, row['code'], row['submitted_at'])
+        if result_key in stored:
+            return dict(stored[result_key]), False, {}, None
+
+        session = code_grader.open_execution_session(row['code'], reuse_runs=True)
+        try:
+            grading_result = code_grader.grade_code(context, row['code'], row['submitted_at'], session)
+            entry = grading_results.entry(result_key, grading_result, session)
+            grading_result['grading_timings'] = grading_timings(grading_result)
+            grading_metrics.record(grading_result['grading_timings'], activity_id=context['activity_id'],
+                                   submission_id=row['id'], regrade=True)
+            return grading_result, False, grading_result.get('execution_timings', {}), entry
+        except SandboxBusy as e:
+            logger.warning(f"Regrade of submission {row['id']} skipped: {str(e)}")
+            return None, True, session.timings(), None
+        except Exception as e:
+            logger.error(f"Error regrading submission {row['id']}: {str(e)}")
+            return None, True, session.timings(), None
+        finally:
+            session.close()
+
+    def _write(self, activity_id, batch, entries=()):
+        if not batch:
+            return
+        cur = mysql.connection.cursor()
+        try:
+            # The code condition skips submissions replaced while they were being regraded
+            if grading_metrics.ensure_column(cur):
+                cur.executemany("""
+                    UPDATE submissions
+                    SET correctness_score=%s, syntax_score=%s, logic_score=%s, feedback=%s,
+                        grading_timings=COALESCE(%s, grading_timings)
+                    WHERE id=%s AND code=%s
+                """, batch)
+            else:
+                cur.executemany("""
+                    UPDATE submissions
+                    SET correctness_score=%s, syntax_score=%s, logic_score=%s, feedback=%s
+                    WHERE id=%s AND code=%s
+                """, [row[:4] + row[5:] for row in batch])
+            grading_results.store(entries, cur)
+            mysql.connection.commit()
+        finally:
+            cur.close()
+        self._add(activity_id, written=len(batch))
+
+
+# Shared per-worker regrade manager
+regrade_manager = RegradeManager()
@@ -0,0 +1,368 @@
+"""Sandboxed execution of student programs.
+
+Student binaries are not spawned from the Flask worker. A small pool of
+pre-forked runner processes (this file run as a script, stdlib only) takes
+jobs over a pipe, applies resource limits in the child before exec'ing the
+program, and sends back the captured output. Forking a runner is cheap
+compared with forking a gunicorn worker that has Flask, numpy and sklearn
+loaded, and a runaway program can only exhaust its own limits.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import select
+import signal
+import selectors
+import threading
+import subprocess
+import logging
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Per-process limits applied to every student program (0 disables a limit)
+DEFAULT_LIMITS = {
+    'cpu_seconds': _env_int('GRADING_RLIMIT_CPU', 5),
+    'address_space_mb': _env_int('GRADING_RLIMIT_AS_MB', 256),
+    'file_size_mb': _env_int('GRADING_RLIMIT_FSIZE_MB', 1),
+    'processes': _env_int('GRADING_RLIMIT_NPROC', 16),
+    # Not an rlimit: captured stdout + stderr beyond this many KB kills the program
+    'output_kb': _env_int('GRADING_OUTPUT_LIMIT_KB', 64),
+}
+
+# Unprivileged uid/gid for student programs when the server runs as root
+# (root ignores RLIMIT_NPROC). Set GRADING_SANDBOX_UID=-1 to keep the current user.
+SANDBOX_UID = _env_int('GRADING_SANDBOX_UID', 65534)
+SANDBOX_GID = _env_int('GRADING_SANDBOX_GID', 65534)
+
+# Runner processes per gunicorn worker
+SANDBOX_RUNNERS = max(1, _env_int('GRADING_SANDBOX_RUNNERS', os.cpu_count() or 1))
+
+# Set GRADING_SANDBOX=0 to run programs directly from the worker (limits still apply)
+SANDBOX_ENABLED = os.environ.get('GRADING_SANDBOX', '1') != '0' and os.name == 'posix'
+
+# Extra seconds to wait for a runner's reply beyond the job's own timeout
+REPLY_GRACE = 5
+
+# Bytes read from (or written to) a program's pipes per call
+PIPE_CHUNK = 32768
+
+# Pipes can be polled with selectors (not on Windows)
+PIPES_POLLABLE = os.name == 'posix'
+
+
+def _limit_setter(limits):
+    """Build a preexec_fn that applies `limits` in the child before exec."""
+    def apply_limits():
+        # Own process group, so a timeout can kill anything the program forked
+        os.setsid()
+        if resource is None:
+            return
+        if limits.get('cpu_seconds'):
+            cpu = int(limits['cpu_seconds'])
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if limits.get('address_space_mb'):
+            size = int(limits['address_space_mb']) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+        if limits.get('file_size_mb'):
+            size = int(limits['file_size_mb']) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_FSIZE, (size, size))
+        if limits.get('processes') and hasattr(resource, 'RLIMIT_NPROC'):
+            count = int(limits['processes'])
+            resource.setrlimit(resource.RLIMIT_NPROC, (count, count))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if os.geteuid() == 0 and SANDBOX_UID >= 0:
+            os.setgroups([])
+            os.setgid(SANDBOX_GID)
+            os.setuid(SANDBOX_UID)
+    return apply_limits
+
+
+def _decode(data):
+    # Same newline handling as subprocess text mode, but never fails on bad bytes
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _kill_group(proc):
+    """Kill the program and everything it forked.
+
+    Repeated until the group is empty, so processes forked while the
+    previous signal was being delivered (e.g. by a fork bomb) die too.
+    """
+    for _ in range(50):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return
+        except (PermissionError, AttributeError):
+            proc.kill()
+            return
+        if proc.poll() is None:
+            proc.wait()
+        time.sleep(0.01)
+
+
+def _communicate(proc, stdin_data, timeout, output_limit):
+    """Feed stdin and read stdout/stderr incrementally until EOF or a limit.
+
+    Unlike Popen.communicate, at most `output_limit` bytes of combined output
+    are ever held in memory (0 disables the cap). Returns
+    (stdout, stderr, timed_out, output_limit_exceeded); the caller kills the
+    process if either flag is set.
+    """
+    if not PIPES_POLLABLE:
+        return _communicate_buffered(proc, stdin_data, timeout, output_limit)
+
+    deadline = time.monotonic() + timeout
+    chunks = {proc.stdout: [], proc.stderr: []}
+    captured = 0
+    pending = memoryview(stdin_data)
+
+    def result(timed_out=False, limit_exceeded=False):
+        return b''.join(chunks[proc.stdout]), b''.join(chunks[proc.stderr]), timed_out, limit_exceeded
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        selector.register(proc.stderr, selectors.EVENT_READ)
+        if pending:
+            os.set_blocking(proc.stdin.fileno(), False)
+            selector.register(proc.stdin, selectors.EVENT_WRITE)
+        else:
+            proc.stdin.close()
+
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return result(timed_out=True)
+
+            for key, _ in selector.select(remaining):
+                stream = key.fileobj
+                if stream is proc.stdin:
+                    try:
+                        pending = pending[os.write(stream.fileno(), pending[:PIPE_CHUNK]):]
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        # The program exited or closed stdin without reading all input
+                        pending = pending[:0]
+                    if not pending:
+                        selector.unregister(stream)
+                        stream.close()
+                    continue
+
+                data = os.read(stream.fileno(), PIPE_CHUNK)
+                if not data:
+                    selector.unregister(stream)
+                    continue
+                if output_limit and captured + len(data) > output_limit:
+                    chunks[stream].append(data[:output_limit - captured])
+                    return result(limit_exceeded=True)
+                chunks[stream].append(data)
+                captured += len(data)
+
+    # Both pipes are closed; the program may still be running (e.g. it closed them itself)
+    try:
+        proc.wait(timeout=max(0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        return result(timed_out=True)
+    return result()
+
+
+def _communicate_buffered(proc, stdin_data, timeout, output_limit):
+    """_communicate where pipes cannot be polled (Windows): Popen.communicate, then the cap.
+
+    The whole output is read before it is truncated, so there the cap
+    bounds what is kept, not what is read.
+    """
+    try:
+        stdout, stderr = proc.communicate(stdin_data, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return b'', b'', True, False
+    if output_limit and len(stdout) + len(stderr) > output_limit:
+        stdout = stdout[:output_limit]
+        return stdout, stderr[:output_limit - len(stdout)], False, True
+    return stdout, stderr, False, False
+
+
+def run_program(argv, stdin_data, timeout, limits=None):
+    """Run argv with stdin_data under resource limits.
+
+    Returns a dict with returncode, stdout, stderr, timed_out,
+    output_limit_exceeded and elapsed.
+    """
+    limits = DEFAULT_LIMITS if limits is None else limits
+    preexec_fn = _limit_setter(limits) if os.name == 'posix' else None
+    output_limit = int(limits.get('output_kb') or 0) * 1024
+
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        preexec_fn=preexec_fn, bufsize=0
+    )
+    timed_out = limit_exceeded = False
+    try:
+        stdout, stderr, timed_out, limit_exceeded = _communicate(
+            proc, (stdin_data or '').encode('utf-8'), timeout, output_limit
+        )
+    finally:
+        # Processes the program forked may outlive it, so kill the group when a limit hit
+        if timed_out or limit_exceeded or proc.poll() is None:
+            _kill_group(proc)
+            proc.wait()
+        for stream in (proc.stdin, proc.stdout, proc.stderr):
+            if not stream.closed:
+                stream.close()
+
+    return {
+        'returncode': proc.returncode,
+        'stdout': _decode(stdout),
+        'stderr': _decode(stderr),
+        'timed_out': timed_out,
+        'output_limit_exceeded': limit_exceeded,
+        'elapsed': time.monotonic() - start
+    }
+
+
+def runner_main():
+    """Runner loop: one JSON job per line on stdin, one JSON reply per line on stdout."""
+    # Keep the protocol channel private; nothing else may write to it
+    channel_in = sys.stdin.buffer
+    channel_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+    for line in channel_in:
+        try:
+            job = json.loads(line)
+            reply = run_program(job['argv'], job.get('stdin', ''), job['timeout'], job.get('limits'))
+        except Exception as e:
+            reply = {'error': f"{type(e).__name__}: {str(e)}"}
+        channel_out.write(json.dumps(reply).encode('utf-8') + b'\n')
+        channel_out.flush()
+
+
+class SandboxBusy(RuntimeError):
+    """No runner became free within the allowed wait, so the program never ran.
+
+    Depends on load, not on the submission: grading it again later can succeed.
+    """
+
+
+class SandboxRunner:
+    """Handle to one runner process."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-I', os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True
+        )
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def request(self, job, reply_timeout):
+        self.proc.stdin.write(json.dumps(job).encode('utf-8') + b'\n')
+        self.proc.stdin.flush()
+        ready, _, _ = select.select([self.proc.stdout], [], [], reply_timeout)
+        if not ready:
+            raise TimeoutError('sandbox runner did not reply')
+        line = self.proc.stdout.readline()
+        if not line:
+            raise EOFError('sandbox runner exited')
+        return json.loads(line)
+
+    def stop(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SandboxPool:
+    """Pool of pre-forked runner processes, started on first use in each worker."""
+
+    def __init__(self, size=SANDBOX_RUNNERS, limits=None):
+        self.size = size
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._pid = None
+
+    def start(self):
+        """Fork the runner processes (again after a fork of this process)."""
+        with self._lock:
+            if self._started and self._pid == os.getpid():
+                return
+            self._idle = queue.Queue()
+            for _ in range(self.size):
+                self._idle.put(SandboxRunner())
+            self._started = True
+            self._pid = os.getpid()
+            logger.info(f"Started {self.size} sandbox runners")
+
+    def run(self, argv, stdin_data, timeout, wait=None, started=None):
+        """Run a program on an idle runner. Same result dict as run_program.
+
+        Waits at most `wait` seconds (None: no limit) for a free runner and
+        raises SandboxBusy after that. `started`, if given, is called once a
+        runner is taken and returns the timeout to use instead, so a caller's
+        time budget need not include the wait.
+        """
+        if not SANDBOX_ENABLED:
+            if started is not None:
+                timeout = started()
+            return run_program(argv, stdin_data, timeout, self.limits)
+
+        self.start()
+        try:
+            runner = self._idle.get(timeout=wait)
+        except queue.Empty:
+            raise SandboxBusy(f"No sandbox runner free within {wait:.1f}s") from None
+        try:
+            if started is not None:
+                timeout = started()
+            if not runner.alive():
+                runner = SandboxRunner()
+            job = {'argv': argv, 'stdin': stdin_data, 'timeout': timeout, 'limits': self.limits}
+            try:
+                reply = runner.request(job, timeout + REPLY_GRACE)
+            except (OSError, EOFError, TimeoutError, ValueError) as e:
+                # A wedged or dead runner is replaced rather than reused
+                logger.error(f"Sandbox runner failed: {str(e)}")
+                runner.stop()
+                runner = SandboxRunner()
+                raise RuntimeError(f"Sandbox runner failed: {str(e)}")
+            if 'error' in reply:
+                raise RuntimeError(reply['error'])
+            return reply
+        finally:
+            self._idle.put(runner)
+
+    def stop(self):
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().stop()
+            self._started = False
+
+
+# Shared per-worker pool
+sandbox_pool = SandboxPool()
+
+
+if __name__ == '__main__':
+    runner_main()
@@ -0,0 +1,121 @@
+"""Schema changes of the grading tables, applied by migrate_db.py.
+
+The grading code does not change the schema on the request path. MySQL
+DDL commits implicitly, so an ALTER run there would split the caller's
+transaction. Run `python migrate_db.py` once per deployment instead (the
+Railway pre-deploy command does). Each migration checks
+information_schema first, so running them again changes nothing.
+
+At runtime SchemaCheck only asks whether a migration is applied. A
+positive answer is kept for the life of the worker. A negative answer
+or an error is logged and asked again after SCHEMA_RECHECK_SECONDS, so a
+feature switches itself on once the migration has run.
+"""
+import os
+import time
+import threading
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    SCHEMA_RECHECK_SECONDS = max(0.0, float(os.environ.get('GRADING_SCHEMA_RECHECK_SECONDS', 60)))
+except ValueError:
+    SCHEMA_RECHECK_SECONDS = 60.0
+
+
+def _first(row):
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def missing_columns(cur, table, columns):
+    """The columns of `table` that do not exist yet."""
+    cur.execute(f"""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+          AND COLUMN_NAME IN ({', '.join(['%s'] * len(columns))})
+    """, (table, *columns))
+    existing = {_first(row) for row in cur.fetchall()}
+    return [column for column in columns if column not in existing]
+
+
+def table_exists(cur, table):
+    cur.execute("""
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return bool(cur.fetchall())
+
+
+GRADING_RESULTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS grading_results (
+        activity_id INT NOT NULL,
+        plan_version INT NOT NULL,
+        code_sha256 CHAR(64) NOT NULL,
+        overdue_penalty INT NOT NULL,
+        grader VARCHAR(255) NOT NULL,
+        correctness_score INT,
+        syntax_score INT,
+        logic_score INT,
+        requirement_score INT,
+        total_score INT,
+        feedback LONGTEXT,
+        created_at DATETIME NOT NULL,
+        PRIMARY KEY (activity_id, plan_version, code_sha256, overdue_penalty)
+    )
+"""
+
+# (table, column, definition) added by migrate()
+COLUMNS = (
+    ('activities', 'grading_plan', 'LONGTEXT NULL'),
+    ('activities', 'grading_plan_version', 'INT NOT NULL DEFAULT 0'),
+    ('submissions', 'grading_timings', 'TEXT NULL'),
+    ('submissions', 'grading_error', 'TEXT NULL'),
+)
+
+
+def migrate(cur):
+    """Apply the missing schema changes. Returns a description of each change made."""
+    applied = []
+    for table, column, definition in COLUMNS:
+        if missing_columns(cur, table, [column]):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            applied.append(f"added {table}.{column}")
+    if not table_exists(cur, 'grading_results'):
+        cur.execute(GRADING_RESULTS_TABLE)
+        applied.append("created grading_results")
+    return applied
+
+
+class SchemaCheck:
+    """Whether the schema a feature needs is in place, asked on the request path.
+
+    `check(cur)` returns True when the schema is there. True is kept;
+    False or an error is logged and checked again after SCHEMA_RECHECK_SECONDS.
+    """
+
+    def __init__(self, feature, check, recheck_seconds=None):
+        self.feature = feature
+        self.check = check
+        self.recheck_seconds = SCHEMA_RECHECK_SECONDS if recheck_seconds is None else recheck_seconds
+        self._lock = threading.Lock()
+        self._ready = False
+        self._checked_at = None
+
+    def ready(self, cur):
+        if self._ready:
+            return True
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.recheck_seconds:
+                return False
+            self._checked_at = time.monotonic()
+        try:
+            ready = bool(self.check(cur))
+        except Exception as e:
+            logger.error(f"{self.feature} disabled, could not check the schema: {str(e)}")
+            return False
+        if not ready:
+            logger.error(f"{self.feature} disabled until the database is migrated (python migrate_db.py)")
+        self._ready = ready
+        return ready
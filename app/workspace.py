@@ -0,0 +1,150 @@
+"""Reusable, RAM-backed scratch directories for compiling and running submissions.
+
+Each gunicorn worker keeps a small pool of directories under
+`<root>/c_insight_ws/<pid>/`, where root is /dev/shm when it is usable.
+A grading job takes a directory from the pool, writes its source and
+binary there, and hands it back emptied. No directories are created or
+removed on the hot path, and nothing touches the disk.
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import threading
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+SHM_DIR = '/dev/shm'
+WORKSPACE_DIRNAME = 'c_insight_ws'
+
+
+def _usable_for_binaries(path):
+    """Writable, and not mounted noexec (Docker mounts /dev/shm noexec by default)."""
+    if not os.path.isdir(path) or not os.access(path, os.W_OK | os.X_OK):
+        return False
+    try:
+        return not os.statvfs(path).f_flag & getattr(os, 'ST_NOEXEC', 0)
+    except OSError:
+        return False
+
+
+def default_root():
+    """GRADING_WORKSPACE_DIR, else /dev/shm when binaries can run there, else the temp dir."""
+    configured = os.environ.get('GRADING_WORKSPACE_DIR')
+    if configured:
+        return configured
+    if sys.platform.startswith('linux') and _usable_for_binaries(SHM_DIR):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    """One scratch directory, owned by a single job until released."""
+
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def clear(self):
+        """Remove everything inside the directory, keeping the directory itself."""
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def release(self):
+        self.manager.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class WorkspaceManager:
+    """Per-process pool of scratch directories, grown on demand."""
+
+    def __init__(self, root=None):
+        self.root = root or default_root()
+        self._lock = threading.Lock()
+        self._free = []
+        self._count = 0
+        self._base = None
+        self._pid = None
+
+    def _process_dir(self):
+        # (Re)created after a fork, so gunicorn workers never share directories
+        if self._pid == os.getpid():
+            return self._base
+
+        parent = os.path.join(self.root, WORKSPACE_DIRNAME)
+        os.makedirs(parent, exist_ok=True)
+        self._sweep_stale(parent)
+
+        base = os.path.join(parent, str(os.getpid()))
+        os.makedirs(base, exist_ok=True)
+        # Sandboxed programs may run as an unprivileged user: allow traversal only
+        os.chmod(parent, 0o711)
+        os.chmod(base, 0o711)
+
+        self._base, self._pid = base, os.getpid()
+        self._free, self._count = [], 0
+        atexit.register(shutil.rmtree, base, True)
+        return base
+
+    def _sweep_stale(self, parent):
+        """Remove directories left behind by workers that are gone."""
+        for name in os.listdir(parent):
+            if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+    def acquire(self):
+        """Take an empty workspace from the pool, creating one if none is free."""
+        with self._lock:
+            base = self._process_dir()
+            if self._free:
+                return self._free.pop()
+            self._count += 1
+            path = os.path.join(base, f"slot-{self._count}")
+        os.makedirs(path, exist_ok=True)
+        os.chmod(path, 0o711)
+        return Workspace(self, path)
+
+    def release(self, workspace):
+        """Empty the workspace and return it to the pool."""
+        try:
+            workspace.clear()
+        except OSError as e:
+            # A directory that cannot be emptied is dropped rather than reused
+            logger.error(f"Could not clean workspace {workspace.path}: {str(e)}")
+            return
+        with self._lock:
+            if workspace.path.startswith(self._base + os.sep):
+                self._free.append(workspace)
+
+
+# Shared per-worker workspace pool
+workspace_manager = WorkspaceManager()
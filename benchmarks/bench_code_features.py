@@ -0,0 +1,74 @@
+"""ML feature extraction: per-submission dicts against the batch matrix.
+
+Sources are the corpus programs (benchmarks/corpus/) cut at random
+line counts, so the analysis cache never hits. Reports sources/s for
+CodeGrader.extract_code_features in a loop, for
+app.code_features.feature_matrix on the whole list, and for the two
+lexer passes (tokenize, mask). It also checks that the loop and the
+matrix agree bit for bit.
+
+    python benchmarks/bench_code_features.py [--sources 5000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def sources(count, seed=42):
+    rng = random.Random(seed)
+    programs = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith('.c'):
+            with open(os.path.join(CORPUS_DIR, name)) as f:
+                programs.append(f.read().split('\n'))
+    codes = []
+    for i in range(count):
+        lines = rng.choice(programs)
+        # The trailing comment keeps every source distinct
+        codes.append('\n'.join(lines[:rng.randint(5, len(lines))]) + f'\n// {i}\n')
+    return codes
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sources', type=int, default=5000, help='submissions to extract')
+    args = parser.parse_args()
+
+    import numpy as np
+    from app.grading import code_grader
+    from app.c_lexer import tokenize, mask, analysis_context
+    from app.code_features import feature_matrix, FEATURE_NAMES
+
+    codes = sources(args.sources)
+    analysis_context.cache_clear()
+    rows, loop_seconds = timed(lambda: [list(code_grader.extract_code_features(code).values()) for code in codes])
+    matrix, batch_seconds = timed(lambda: feature_matrix(codes))
+    _, tokenize_seconds = timed(lambda: [tokenize(code) for code in codes])
+    _, mask_seconds = timed(lambda: [mask(code) for code in codes])
+
+    print(f"{len(codes)} sources, {len(FEATURE_NAMES)} features")
+    print(f"{'':<28} {'sources/s':>10}")
+    for label, seconds in (('extract_code_features loop', loop_seconds), ('feature_matrix', batch_seconds),
+                           ('lexer: tokenize', tokenize_seconds), ('lexer: mask', mask_seconds)):
+        print(f"{label:<28} {len(codes) / seconds:>10.0f}")
+
+    identical = matrix.shape == (len(codes), len(FEATURE_NAMES)) and \
+        (matrix.view(np.int64) == np.array(rows, dtype=np.float64).view(np.int64)).all()
+    print(f"bit-identical: {'yes' if identical else 'NO'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
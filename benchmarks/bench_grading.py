@@ -0,0 +1,243 @@
+"""Grading throughput, per-stage latency and peak RSS on the checked-in C corpus.
+
+Grades every program in benchmarks/corpus/ (listed in manifest.json with the
+activity it is graded against) through CodeGrader.grade_code, the database
+free core of grade_submission, so neither Flask nor MySQL is needed. The
+corpus covers correct solutions, wrong output, syntax errors, runtime
+crashes, an infinite loop, an output flood, large inputs and a long file.
+
+Precompiled headers and the compile cache live in a temporary directory.
+The compile cache is off unless --compile-cache is given; then the first
+round is cold and later rounds hit it. Scores are recorded with the
+timings, so a baseline comparison also shows whether a change altered
+grades.
+
+    python benchmarks/bench_grading.py [--concurrency 4] [--rounds 3] [--compile-cache]
+                                       [--only CATEGORY] [--save-baseline FILE] [--baseline FILE]
+"""
+import os
+import sys
+import json
+import atexit
+import shutil
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grading_baseline.json')
+
+sys.path.insert(0, REPO_DIR)
+
+# Stages reported, in grading order (see app.grading_metrics)
+STAGES = ('requirement_check', 'syntax_check', 'compile', 'test_execution', 'test_run',
+          'output_comparison', 'static_analysis', 'feedback_formatting', 'total')
+
+
+def generate_test_case(spec):
+    """A test case from a manifest generator spec (large inputs are not checked in)."""
+    if spec['generate'] == 'numbers':
+        rng = random.Random(spec.get('seed', 0))
+        numbers = [rng.randint(-1000, 1000) for _ in range(spec['count'])]
+        return {'input': f"{len(numbers)}\n" + ' '.join(map(str, numbers)), 'output': str(sum(numbers))}
+    raise ValueError(f"Unknown test case generator: {spec['generate']}")
+
+
+def load_corpus(only=None):
+    with open(os.path.join(CORPUS_DIR, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    activities = {}
+    for name, activity in manifest['activities'].items():
+        test_cases = [generate_test_case(test_case) if 'generate' in test_case else test_case
+                      for test_case in activity['test_cases']]
+        correctness_w, syntax_w, logic_w = activity['weights']
+        activities[name] = {
+            'description': activity['description'],
+            'instructions': activity['instructions'],
+            'due_date': None,
+            'correctness_weight': correctness_w,
+            'syntax_weight': syntax_w,
+            'logic_weight': logic_w,
+            'test_cases_json': json.dumps(test_cases),
+        }
+
+    programs = []
+    for program in manifest['programs']:
+        if only and program['category'] not in only:
+            continue
+        with open(os.path.join(CORPUS_DIR, program['file'])) as f:
+            programs.append(dict(program, code=f.read()))
+    return activities, programs
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+def peak_rss_mb():
+    """Peak RSS of this process in MB. Compiles and test runs are separate processes."""
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def compare(report, baseline):
+    """Print the report next to a saved baseline."""
+    settings = ('concurrency', 'rounds', 'compile_cache', 'programs')
+    changed = [name for name in settings if report['settings'].get(name) != baseline['settings'].get(name)]
+    if changed:
+        print(f"\nNote: the baseline was run with other settings ({', '.join(changed)})")
+
+    def line(label, old, new, higher_is_better=False):
+        if old is None or new is None:
+            print(f"{label:<34} {str(old):>10} {str(new):>10}")
+            return
+        change = (new - old) / old * 100 if old else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        verdict = '' if abs(change) < 5 else ('better' if better else 'worse')
+        print(f"{label:<34} {old:>10.1f} {new:>10.1f} {change:>+8.1f}%  {verdict}")
+
+    print(f"\n{'vs baseline':<34} {'baseline':>10} {'current':>10} {'change':>9}")
+    line('submissions/s', baseline['submissions_per_sec'], report['submissions_per_sec'], higher_is_better=True)
+    for stage in STAGES:
+        old = baseline['stages'].get(stage)
+        new = report['stages'].get(stage)
+        if old and new:
+            line(f"{stage} p50 ms", old['p50_ms'], new['p50_ms'])
+            line(f"{stage} p95 ms", old['p95_ms'], new['p95_ms'])
+    line('peak RSS MB', baseline['peak_rss_mb'], report['peak_rss_mb'])
+
+    changed_scores = [name for name, scores in report['scores'].items()
+                      if name in baseline['scores'] and baseline['scores'][name] != scores]
+    for name in changed_scores:
+        print(f"Scores changed for {name}: {baseline['scores'][name]} -> {report['scores'][name]}")
+    if not changed_scores:
+        print("Scores: unchanged")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=4, help='submissions graded at the same time')
+    parser.add_argument('--rounds', type=int, default=3, help='times the whole corpus is graded')
+    parser.add_argument('--compile-cache', action='store_true', help='use the compile cache across rounds')
+    parser.add_argument('--only', action='append', metavar='CATEGORY',
+                        help='grade only programs of this category (repeatable)')
+    parser.add_argument('--save-baseline', metavar='FILE', help='write the report as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', default=DEFAULT_BASELINE,
+                        help='baseline to compare with (default: benchmarks/grading_baseline.json)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_grading_')
+    atexit.register(shutil.rmtree, work_dir, True)
+    # Read by app modules at import time
+    os.environ['GRADING_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+    os.environ['GRADING_PCH_DIR'] = os.path.join(work_dir, 'pch')
+    if not args.compile_cache:
+        os.environ['GRADING_CACHE_DISABLED'] = '1'
+
+    from app.grading import code_grader
+    from app.grading_plan import compile_plan, plan_context
+    from app.grading_metrics import grading_timings
+    from app.execution import COMPILE_FLAGS
+    from app.compile_cache import gcc_version
+    from app.pch import precompiled_headers
+
+    # The grader logs every grade at INFO and every failed test at WARNING
+    logging.getLogger().setLevel(logging.ERROR)
+
+    activities, programs = load_corpus(args.only)
+    if not programs:
+        parser.error('no programs match --only')
+
+    start = time.perf_counter()
+    built = precompiled_headers.build(COMPILE_FLAGS)
+    print(f"Built {built} precompiled preludes in {time.perf_counter() - start:.2f}s")
+    contexts = {name: plan_context(index, compile_plan(code_grader, activity))
+                for index, (name, activity) in enumerate(activities.items(), 1)}
+
+    def grade(program):
+        session = code_grader.open_execution_session(program['code'])
+        try:
+            return program, code_grader.grade_code(contexts[program['activity']], program['code'], None, session)
+        finally:
+            session.close()
+
+    samples = {stage: [] for stage in STAGES}
+    per_program = {program['file']: [] for program in programs}
+    scores = {}
+    round_rates = []
+    total_wall = 0.0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for round_number in range(1, args.rounds + 1):
+            start = time.perf_counter()
+            results = list(pool.map(grade, programs))
+            wall = time.perf_counter() - start
+            total_wall += wall
+            round_rates.append(len(programs) / wall)
+            print(f"Round {round_number}: {len(programs)} submissions in {wall:.2f}s "
+                  f"({len(programs) / wall:.2f}/s)")
+
+            for program, result in results:
+                timings = grading_timings(result)
+                for stage, ms in timings['stages'].items():
+                    if stage in samples:
+                        samples[stage].append(ms)
+                samples['test_run'].extend(timings['test_runs'])
+                samples['total'].append(timings['total'])
+                per_program[program['file']].append(timings['total'])
+                scores[program['file']] = [result['correctness_score'], result['syntax_score'],
+                                           result['logic_score'], result['total_score']]
+
+    report = {
+        'settings': {
+            'concurrency': args.concurrency,
+            'rounds': args.rounds,
+            'compile_cache': args.compile_cache,
+            'programs': len(programs),
+            'python': platform.python_version(),
+            'gcc': gcc_version(),
+            'cpus': os.cpu_count(),
+        },
+        'submissions_per_sec': round(len(programs) * args.rounds / total_wall, 2),
+        'round_submissions_per_sec': [round(rate, 2) for rate in round_rates],
+        'stages': {
+            stage: {'count': len(values), 'p50_ms': percentile(values, 0.50), 'p95_ms': percentile(values, 0.95)}
+            for stage, values in samples.items() if values
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'scores': scores,
+    }
+
+    print(f"\n{'program':<30} {'category':<14} {'scores (c/s/l/total)':<22} {'p50 ms':>9}")
+    for program in programs:
+        name = program['file']
+        print(f"{name:<30} {program['category']:<14} {'/'.join(map(str, scores[name])):<22} "
+              f"{percentile(per_program[name], 0.50):>9.1f}")
+
+    print(f"\n{'stage':<22} {'samples':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage in STAGES:
+        summary = report['stages'].get(stage)
+        if summary:
+            print(f"{stage:<22} {summary['count']:>8} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f}")
+    print(f"\nsubmissions/s: {report['submissions_per_sec']:.2f} at concurrency {args.concurrency}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""ML inference throughput with and without micro-batching at 1, 8 and 64 concurrent submissions.
+
+Each concurrent submission is a thread predicting one feature row at a
+time, as the 'ml_scores' grading stage does. Direct mode calls
+app.ml_models.predict per row. Batched mode goes through
+app.ml_batcher.InferenceBatcher. The models are fitted on the corpus
+training set of bench_ml_models.py.
+
+    python benchmarks/bench_ml_batching.py [--rows 640] [--format three|multi|linear] [--wait-ms 2]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ml_models import training_set
+
+
+def run(concurrency, rows, predict_one):
+    """(rows/s, p50 ms, p95 ms) with `concurrency` threads sharing `rows` predictions."""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_rows):
+        own = []
+        for row in worker_rows:
+            start = time.perf_counter()
+            predict_one(row)
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker, args=(rows[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return len(rows) / elapsed, latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=640, help='predictions per concurrency level and mode')
+    parser.add_argument('--format', choices=('three', 'multi', 'linear'), default='three',
+                        help='three forests, one multi-output forest, or the distilled linear student')
+    parser.add_argument('--wait-ms', type=float, default=2.0, help='batch collection window')
+    parser.add_argument('--max-batch', type=int, default=64, help='rows per batch at most')
+    args = parser.parse_args()
+
+    from app.grading import code_grader
+    from app.ml_models import fit_models, distill, predict
+    from app.ml_batcher import InferenceBatcher
+
+    X, y = training_set(code_grader, 1000)
+    models = fit_models(X, y, multi_output=args.format != 'three')
+    backend = 'forest'
+    if args.format == 'linear':
+        models['distilled'] = distill(models, X, 'linear')
+        backend = 'distilled'
+    rows = [X[i % len(X)] for i in range(args.rows)]
+
+    print(f"{'concurrency':>11} {'mode':<8} {'rows/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'mean batch':>11}")
+    for concurrency in (1, 8, 64):
+        rate, p50, p95 = run(concurrency, rows, lambda row: predict(models, [row], backend=backend))
+        print(f"{concurrency:>11} {'direct':<8} {rate:>9.1f} {p50:>8.2f} {p95:>8.2f} {'':>11}")
+
+        batcher = InferenceBatcher(max_batch=args.max_batch, max_wait_ms=args.wait_ms, enabled=True)
+        rate, p50, p95 = run(concurrency, rows, lambda row: batcher.predict(models, row, backend=backend))
+        # The linear student bypasses the batcher, so it forms no batches
+        mean_batch = batcher.stats()['mean_batch'] or '-'
+        print(f"{concurrency:>11} {'batched':<8} {rate:>9.1f} {p50:>8.2f} {p95:>8.2f} {mean_batch:>11}")
+
+
+if __name__ == '__main__':
+    main()
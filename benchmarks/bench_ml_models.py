@@ -0,0 +1,108 @@
+"""Prediction latency and model size: three forests, one multi-output forest, distilled students.
+
+Fits both model formats of app.ml_models on the same training set, plus
+the linear and boosted students distilled from the multi-output forest,
+and reports fit time, file size, load time (joblib, memory-mapped) and
+prediction latency for one submission and for a batch. File sizes of the
+students include the forest they are stored with. The training rows
+are the features of the benchmark corpus (benchmarks/corpus/) and of
+prefixes of those programs, with synthetic scores.
+
+    python benchmarks/bench_ml_models.py [--samples 1000] [--runs 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def training_set(grader, samples, seed=42):
+    """Feature rows of corpus program prefixes, and synthetic (correctness, logic, syntax) scores."""
+    rng = random.Random(seed)
+    programs = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith('.c'):
+            with open(os.path.join(CORPUS_DIR, name)) as f:
+                programs.append(f.read().split('\n'))
+
+    X, y = [], []
+    for _ in range(samples):
+        lines = rng.choice(programs)
+        code = '\n'.join(lines[:rng.randint(5, len(lines))])
+        features = grader.extract_code_features(code)
+        X.append(list(features.values()))
+        correctness = min(100, 40 + 5 * features['printf_calls'] + rng.uniform(-10, 10))
+        logic = min(100, 50 + 3 * features['decision_points'] + rng.uniform(-10, 10))
+        syntax = 100 - min(100, 20 * features['brace_balance'] + rng.uniform(0, 10))
+        y.append([correctness, logic, syntax])
+    return X, y
+
+
+def latency_ms(func, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[min(len(times) - 1, int(len(times) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--samples', type=int, default=1000, help='training rows')
+    parser.add_argument('--runs', type=int, default=200, help='predictions timed per format')
+    parser.add_argument('--batch', type=int, default=64, help='rows per batch prediction')
+    args = parser.parse_args()
+
+    import numpy as np
+    from app.grading import code_grader
+    from app.ml_models import ModelStore, fit_models, distill, predict, TARGETS
+
+    X, y = training_set(code_grader, args.samples)
+    single = X[:1]
+    batch = X[:args.batch]
+
+    print(f"{'format':<18} {'fit s':>7} {'file MB':>8} {'load ms':>8} "
+          f"{'1 row p50 ms':>13} {'p95 ms':>7} {f'{args.batch} rows p50 ms':>16}")
+    predictions = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for label, multi_output, student in (('three forests', False, None), ('multi-output', True, None),
+                                             ('distilled linear', True, 'linear'),
+                                             ('distilled boosted', True, 'boosted')):
+            start = time.perf_counter()
+            models = fit_models(X, y, multi_output=multi_output)
+            if student:
+                # Fit time of the student alone
+                start = time.perf_counter()
+                models['distilled'] = distill(models, X, student)
+            fit_s = time.perf_counter() - start
+            backend = 'distilled' if student else 'forest'
+
+            store = ModelStore(registry_dir=os.path.join(work_dir, label.replace(' ', '_')), legacy_paths=())
+            store.publish(models)
+            models = store.get()
+            info = store.stats()
+
+            single_p50, single_p95 = latency_ms(lambda: predict(models, single, backend=backend), args.runs)
+            batch_p50, _ = latency_ms(lambda: predict(models, batch, backend=backend), max(1, args.runs // 10))
+            predictions[label] = predict(models, X, backend=backend)
+            print(f"{label:<18} {fit_s:>7.2f} {info['file_mb']:>8.2f} {info['load_ms']:>8.1f} "
+                  f"{single_p50:>13.2f} {single_p95:>7.2f} {batch_p50:>16.2f}")
+
+    print("\nMean absolute difference of training-set predictions from the three forests:")
+    for label, values in predictions.items():
+        if label != 'three forests':
+            difference = np.abs(values - predictions['three forests']).mean(axis=0)
+            print(f"  {label:<18} " + ', '.join(f"{target} {value:.2f}" for target, value in zip(TARGETS, difference)))
+
+
+if __name__ == '__main__':
+    main()
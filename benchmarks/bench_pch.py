@@ -0,0 +1,102 @@
+"""Compile latency with and without precompiled headers.
+
+Compiles a few typical submissions repeatedly, once with plain gcc and once
+with the matching prelude from app.pch, the same way ExecutionSession and
+the syntax check invoke gcc (the compile cache is bypassed).
+
+    python benchmarks/bench_pch.py [--runs 20]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.pch import PrecompiledHeaders
+from app.execution import COMPILE_FLAGS
+
+
+SAMPLES = {
+    'hello (stdio)': """#include <stdio.h>
+
+int main() {
+    printf("Hello, World!\\n");
+    return 0;
+}
+""",
+    'array sum (stdio, stdlib)': """#include <stdio.h>
+#include <stdlib.h>
+
+int main() {
+    int n, i, sum = 0;
+    scanf("%d", &n);
+    int *values = malloc(n * sizeof(int));
+    for (i = 0; i < n; i++) {
+        scanf("%d", &values[i]);
+        sum += values[i];
+    }
+    printf("%d\\n", sum);
+    free(values);
+    return 0;
+}
+""",
+    'strings (stdio, stdlib, string, math)': """#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+int main() {
+    char word[100];
+    scanf("%99s", word);
+    int length = strlen(word);
+    printf("%d %.2f\\n", length, fabs(-1.5 * length));
+    return 0;
+}
+""",
+}
+
+
+def time_compile(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(argv, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20, help='compiles per sample and mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pch = PrecompiledHeaders(pch_dir=os.path.join(work_dir, 'pch'), enabled=True)
+        start = time.perf_counter()
+        built = pch.build(COMPILE_FLAGS)
+        print(f"Built {built} precompiled preludes in {time.perf_counter() - start:.2f}s\n")
+
+        print(f"{'sample':<40} {'mode':<14} {'median ms':>10} {'p95 ms':>8}")
+        for name, code in SAMPLES.items():
+            code_file = os.path.join(work_dir, 'student_code.c')
+            with open(code_file, 'w') as f:
+                f.write(code)
+            base = [code_file, '-o', os.path.join(work_dir, 'student_code.exe')] + COMPILE_FLAGS
+            include = pch.include_flags(code, COMPILE_FLAGS)
+
+            for mode, argv in (('plain', ['gcc'] + base), ('pch', ['gcc'] + include + base),
+                               ('syntax plain', ['gcc', '-fsyntax-only', code_file] + COMPILE_FLAGS),
+                               ('syntax pch', ['gcc', '-fsyntax-only'] + include + [code_file] + COMPILE_FLAGS)):
+                times = sorted(time_compile(argv, args.runs))
+                p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+                print(f"{name:<40} {mode:<14} {statistics.median(times) * 1000:>10.1f} {p95 * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+#include <stdio.h>
+
+int average(int total, int count) {
+    return total / count;
+}
+
+int main() {
+    int a, b, count = 0;
+    scanf("%d %d", &a, &b);
+    if (a < 0) {
+        count = 2;
+    }
+    printf("%d\n", a + b + average(a + b, count) * 0);
+    return 0;
+}
@@ -0,0 +1,14 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+int main() {
+    int a, b;
+    int *result = NULL;
+    scanf("%d %d", &a, &b);
+    if (a + b > 1000000) {
+        result = malloc(sizeof(int));
+    }
+    *result = a + b;
+    printf("%d\n", *result);
+    return 0;
+}
@@ -0,0 +1,12 @@
+#include <stdio.h>
+
+int main() {
+    int a, b, i = 0;
+    scanf("%d %d", &a, &b);
+    while (i < 10) {
+        a = a + b;
+        i = i * 2;
+    }
+    printf("%d\n", a);
+    return 0;
+}
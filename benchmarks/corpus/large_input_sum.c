@@ -0,0 +1,25 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+int main() {
+    int n;
+    long long sum = 0;
+    if (scanf("%d", &n) != 1 || n <= 0) {
+        printf("0\n");
+        return 0;
+    }
+
+    int *values = malloc(n * sizeof(int));
+    if (values == NULL) {
+        return 1;
+    }
+    for (int i = 0; i < n; i++) {
+        scanf("%d", &values[i]);
+    }
+    for (int i = 0; i < n; i++) {
+        sum += values[i];
+    }
+    printf("%lld\n", sum);
+    free(values);
+    return 0;
+}
@@ -0,0 +1,10 @@
+#include <stdio.h>
+
+int main() {
+    int n;
+    scanf("%d", &n);
+    for (int i = 1; i <= n || 1; i++) {
+        printf("%d squared is %d\n", i, i * i);
+    }
+    return 0;
+}
@@ -0,0 +1,12 @@
+#include <stdio.h>
+
+int main() {
+    int n;
+    printf("Enter a number: ");
+    scanf("%d", &n);
+    // Print the square of every number from 1 to n
+    for (int i = 1; i <= n; i++) {
+        printf("%d\n", i * i);
+    }
+    return 0;
+}
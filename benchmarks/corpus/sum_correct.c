@@ -0,0 +1,13 @@
+#include <stdio.h>
+
+int main() {
+    int a, b;
+    // Read two numbers and print their sum
+    scanf("%d %d", &a, &b);
+    if (a + b >= 0) {
+        printf("%d\n", a + b);
+    } else {
+        printf("%d\n", a + b);
+    }
+    return 0;
+}
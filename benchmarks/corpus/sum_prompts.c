@@ -0,0 +1,18 @@
+#include <stdio.h>
+
+int main() {
+    int first, second, total;
+
+    printf("Enter the first number: ");
+    scanf("%d", &first);
+    printf("Enter the second number: ");
+    scanf("%d", &second);
+
+    total = first + second;
+    if (total < 0) {
+        printf("Result: %d (negative)\n", total);
+    } else {
+        printf("Result: %d\n", total);
+    }
+    return 0;
+}
@@ -0,0 +1,10 @@
+#include <stdio.h>
+
+int main() {
+    int a;
+    scanf("%d %d", &a, &b);
+    if (a > 0) {
+        printf("%d\n", a + b);
+    }
+    return 0;
+}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Apply the schema changes the grading code needs (see app/schema.py).
+
+Run once per deployment, before the workers start serving (the Railway
+pre-deploy command runs it). Changes already applied are skipped, so it
+is safe to run again.
+
+    python migrate_db.py [--check]
+"""
+
+import sys
+import os
+import argparse
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, mysql
+from app import schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the grading schema changes.")
+    parser.add_argument('--check', action='store_true',
+                        help='only report missing changes; exit with status 1 if there are any')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        try:
+            if args.check:
+                missing = [f"{table}.{column}" for table, column, _ in schema.COLUMNS
+                           if schema.missing_columns(cur, table, [column])]
+                if not schema.table_exists(cur, 'grading_results'):
+                    missing.append('grading_results')
+                for name in missing:
+                    print(f" missing: {name}")
+                print("Schema is up to date." if not missing else f"{len(missing)} changes missing.")
+                return 1 if missing else 0
+
+            applied = schema.migrate(cur)
+            mysql.connection.commit()
+        finally:
+            cur.close()
+
+    for change in applied:
+        print(f" {change}")
+    print("Schema is up to date." if not applied else f"Applied {len(applied)} schema changes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
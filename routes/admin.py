@@ -387,6 +387,35 @@ def monthlyStats():
     result = [{'month': row['month'], 'count': row['count']} for row in data]
     return jsonify(result)
 
+@admin_bp.route('/grading/cache_stats')
+def gradingCacheStats():
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from app.compile_cache import compile_cache
+    from app.grading_plan import grading_plans
+    from app.grading_results import grading_results
+    from app.ml_models import ml_model_store
+    from app.ml_batcher import ml_batcher
+
+    # Counters are per gunicorn worker; the on-disk size is shared
+    stats = compile_cache.stats()
+    stats['grading_plans'] = grading_plans.stats()
+    stats['grading_results'] = grading_results.stats()
+    stats['ml_models'] = ml_model_store.stats()
+    stats['ml_models']['batching'] = ml_batcher.stats()
+    return jsonify(stats)
+
+@admin_bp.route('/grading/timings')
+def gradingTimings():
+    if 'username' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from app.grading_metrics import grading_metrics
+
+    # Per-stage latency histograms of this gunicorn worker
+    return jsonify(grading_metrics.snapshot())
+
 @admin_bp.route('/notifications/count')
 def notificationsCount():
     if 'username' not in session or session.get('role') != 'admin':
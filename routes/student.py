@@ -1,9 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import mysql
 from datetime import datetime, timedelta
 import MySQLdb
-import time
 import json
 
 student_bp = Blueprint('student', __name__)
@@ -623,6 +622,8 @@ def viewActivity(activity_id):
 @student_bp.route('/submit_activity/<int:activity_id>', methods=['POST'])
 def submit_activity(activity_id):
     from app.grading import grade_submission
+    from app.grading_queue import (grading_queue, store_grading_result, store_grading_error,
+                                   grading_error_column, ASYNC_GRADING)
 
     if 'username' not in session or session.get('role') != 'student':
         flash('Unauthorized access', 'error')
@@ -634,6 +635,8 @@ def submit_activity(activity_id):
         return redirect(url_for('student.viewActivity', activity_id=activity_id))
 
     cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    queued = False
+    submission_id = None
 
     try:
         # Get student ID
@@ -668,8 +671,18 @@ def submit_activity(activity_id):
 
         now = datetime.now()
 
-        if submission:
-            # Update existing submission
+        if submission and ASYNC_GRADING:
+            # Update existing submission; clear old scores (and a failed job's error) until the new code is graded
+            grading_error = ', grading_error=NULL' if grading_error_column.ready(cur) else ''
+            cur.execute(f"""
+                UPDATE submissions
+                SET code=%s, submitted_at=%s, correctness_score=NULL, syntax_score=NULL,
+                    logic_score=NULL, feedback=NULL{grading_error}
+                WHERE id=%s
+            """, (code, now, submission['id']))
+            submission_id = submission['id']
+        elif submission:
+            # Graded below in this request: the old scores stay if grading fails
             cur.execute("""
                 UPDATE submissions
                 SET code=%s, submitted_at=%s
@@ -686,29 +699,25 @@ def submit_activity(activity_id):
 
         mysql.connection.commit()
 
-        # Simulate grading delay
-        time.sleep(3)
-
-        # Grade the submission
-        grading_result = grade_submission(activity_id, student_id, code)
-
-        if 'error' not in grading_result:
-            # Update submission with scores and feedback
-            cur.execute("""
-                UPDATE submissions
-                SET correctness_score=%s, syntax_score=%s, logic_score=%s, feedback=%s
-                WHERE id=%s
-            """, (
-                grading_result['correctness_score'],
-                grading_result['syntax_score'],
-                grading_result['logic_score'],
-                grading_result['feedback'],
-                submission_id
-            ))
-            mysql.connection.commit()
-            message = 'Activity submitted and graded successfully!'
+        if ASYNC_GRADING:
+            # Grade in the background; the status endpoint reports progress
+            grading_queue.submit(current_app._get_current_object(), submission_id,
+                                 activity_id, student_id, code)
+            message = 'Activity submitted successfully! Grading is in progress.'
+            queued = True
         else:
-            message = f"Activity submitted but grading failed: {grading_result['error']}"
+            # Grade the submission
+            grading_result = grade_submission(activity_id, student_id, code)
+
+            if 'error' not in grading_result:
+                # Update submission with scores and feedback
+                store_grading_result(cur, submission_id, grading_result)
+                mysql.connection.commit()
+                message = 'Activity submitted and graded successfully!'
+            else:
+                store_grading_error(cur, submission_id, code, grading_result['error'])
+                mysql.connection.commit()
+                message = f"Activity submitted but grading failed: {grading_result['error']}"
 
     except Exception as e:
         mysql.connection.rollback()
@@ -717,12 +726,65 @@ def submit_activity(activity_id):
         cur.close()
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if queued:
+            return jsonify({
+                'message': message,
+                'submission_id': submission_id,
+                'status': 'queued',
+                'status_url': url_for('student.submission_status', submission_id=submission_id)
+            }), 202
         return jsonify({'message': message})
     else:
         flash(message, 'success' if 'successfully' in message else 'error')
         return redirect(url_for('student.viewActivity', activity_id=activity_id))
 
 
+@student_bp.route('/submission/<int:submission_id>/status')
+def submission_status(submission_id):
+    from app.grading_queue import grading_queue, grading_state, grading_error_column
+
+    if 'username' not in session or session.get('role') != 'student':
+        return jsonify({'error': 'Unauthorized access'}), 401
+
+    cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    try:
+        grading_error = 's.grading_error' if grading_error_column.ready(cur) else 'NULL AS grading_error'
+        cur.execute(f"""
+            SELECT s.id, s.correctness_score, s.syntax_score, s.logic_score, s.submitted_at, {grading_error},
+                    a.correctness_weight, a.syntax_weight, a.logic_weight
+            FROM submissions s
+            JOIN users u ON s.student_id = u.id
+            JOIN activities a ON s.activity_id = a.id
+            WHERE s.id = %s AND u.username = %s
+        """, (submission_id, session['username']))
+        submission = cur.fetchone()
+    finally:
+        cur.close()
+
+    if not submission:
+        return jsonify({'error': 'Submission not found'}), 404
+
+    # Jobs queued by this worker have live state; otherwise the stored row tells
+    state = grading_state(submission, grading_queue.status(submission_id))
+    if state is not None:
+        return jsonify(dict(state, submission_id=submission_id))
+
+    total_score = (
+        (submission['correctness_score'] or 0) * float(submission['correctness_weight'] or 0) / 100 +
+        (submission['syntax_score'] or 0) * float(submission['syntax_weight'] or 0) / 100 +
+        (submission['logic_score'] or 0) * float(submission['logic_weight'] or 0) / 100
+    )
+
+    return jsonify({
+        'submission_id': submission_id,
+        'status': 'done',
+        'correctness_score': submission['correctness_score'],
+        'syntax_score': submission['syntax_score'],
+        'logic_score': submission['logic_score'],
+        'total_score': int(total_score)
+    })
+
+
 @student_bp.route('/un_enroll/<int:class_id>', methods=['POST'])
 def un_enroll(class_id):
     if 'username' not in session or session.get('role') != 'student':
@@ -1022,6 +1022,11 @@ def create_activity():
         activity_id_row = cur.fetchone()
         activity_id = activity_id_row['LAST_INSERT_ID()']
 
+        # Compile the grading plan now, so grading never re-derives it per submission
+        from app.grading import code_grader
+        from app.grading_plan import grading_plans
+        grading_plans.save(cur, activity_id, code_grader)
+
         mysql.connection.commit()
 
         # Notify students about the new activity (non-critical, so ignore errors)
@@ -1175,6 +1180,14 @@ def manage_activity(activity_id):
                 if not cur.fetchone():
                     return jsonify({'error': 'Unauthorized access to class'}), 403
 
+            # Remember the grading inputs to tell whether existing submissions need a regrade
+            cur.execute("""
+                SELECT description, instructions, due_date, test_cases_json,
+                       correctness_weight, syntax_weight, logic_weight
+                FROM activities WHERE id=%s AND teacher_id=%s
+            """, (activity_id, teacher_id))
+            previous = cur.fetchone()
+
             # Update activity in database
             if class_id and class_id.strip():
                 cur.execute("""
@@ -1201,7 +1214,30 @@ def manage_activity(activity_id):
                     activity_id, teacher_id
                 ))
 
+            # Recompile the grading plan; the new version retires cached copies in every worker
+            if previous:
+                from app.grading import code_grader
+                from app.grading_plan import grading_plans
+                grading_plans.save(cur, activity_id, code_grader)
+
             mysql.connection.commit()
+
+            # Scores of existing submissions were computed against the old tests/text/due date/weights
+            if previous and (previous['test_cases_json'] != test_cases_json or
+                             previous['due_date'] != due_date or
+                             previous['description'] != description or
+                             previous['instructions'] != instructions or
+                             previous['correctness_weight'] != correctness_weight or
+                             previous['syntax_weight'] != syntax_weight or
+                             previous['logic_weight'] != logic_weight):
+                from app.regrade import regrade_manager
+                regrade = regrade_manager.start(app._get_current_object(), activity_id)
+                return jsonify({
+                    'success': 'Activity updated successfully. Existing submissions are being regraded.',
+                    'regrade': regrade,
+                    'regrade_status_url': url_for('teacher.regrade_activity', activity_id=activity_id)
+                })
+
             return jsonify({'success': 'Activity updated successfully'})
             
         elif request.method == 'DELETE':
@@ -1238,6 +1274,36 @@ def manage_activity(activity_id):
     
 
     
+@teacher_bp.route('/activity/<int:activity_id>/regrade', methods=['GET', 'POST'])
+def regrade_activity(activity_id):
+    """POST starts a bulk regrade of the activity's submissions; GET reports its progress."""
+    if 'username' not in session or session.get('role') != 'teacher':
+        return jsonify({'error': 'Unauthorized access'}), 401
+
+    from app.regrade import regrade_manager
+
+    cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    try:
+        cur.execute("""
+            SELECT a.id FROM activities a
+            JOIN users u ON a.teacher_id = u.id
+            WHERE a.id=%s AND u.username=%s
+        """, (activity_id, session['username']))
+        if not cur.fetchone():
+            return jsonify({'error': 'Activity not found'}), 404
+    finally:
+        cur.close()
+
+    if request.method == 'POST':
+        job = regrade_manager.start(app._get_current_object(), activity_id)
+        return jsonify(job), 202
+
+    job = regrade_manager.status(activity_id)
+    if job is None:
+        return jsonify({'activity_id': activity_id, 'status': 'idle'})
+    return jsonify(job)
+
+
 @teacher_bp.route('/classes')
 def teacherClasses():
     if 'username' not in session or session.get('role') != 'teacher':
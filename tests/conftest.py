@@ -0,0 +1,83 @@
+import pytest
+from flask_mysqldb import MySQL
+from app import create_app
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        self.db.queries.append((query, args))
+        self.rows = self.db.respond(query, args)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    """Stands in for the MySQL connection: queries get the rows registered for a fragment of their SQL."""
+
+    def __init__(self):
+        self.responses = []
+        self.queries = []
+        self.commits = 0
+
+    def on(self, fragment, rows):
+        """Answer queries containing `fragment` with `rows` (a list, or a function of the query args)."""
+        self.responses.insert(0, (fragment, rows))
+
+    def respond(self, query, args):
+        for fragment, rows in self.responses:
+            if fragment in query:
+                return rows(args) if callable(rows) else rows
+        return []
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(MySQL, 'connection', property(lambda self: fake))
+    return fake
+
+
+@pytest.fixture
+def app(db):
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def student_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'student1'
+        session['role'] = 'student'
+    return client
+
+
+@pytest.fixture
+def teacher_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'teacher1'
+        session['role'] = 'teacher'
+    return client
@@ -0,0 +1,29 @@
+from app.grading import CodeGrader
+
+
+def clean(output, additional_keywords=None):
+    return CodeGrader().clean_prompts(output, additional_keywords)
+
+
+def test_prompts_are_removed_and_values_kept():
+    assert clean('Enter a number: 5\nResult: 10') == 'a number: 5\n10'
+    assert clean('Please enter your name:\nAlice') == 'your name:\nAlice'
+
+
+def test_removal_exposes_a_later_phrase():
+    # 'input' goes first and leaves 'reply', which is then removed as well
+    assert clean('repinputly 5') == '5'
+    # a phrase already applied is not applied again
+    assert clean('ininputput 5') == 'input 5'
+
+
+def test_same_length_phrases_apply_alphabetically():
+    # 'enter your' (no match yet) comes before 'input here'; removing
+    # 'Input here' leaves 'Enter your' behind
+    assert clean('ininputput Enter Input here your \t') == 'input your'
+
+
+def test_additional_keywords():
+    assert clean('Sum: 7\nTotal = 9', 'sum, total') == '7\n= 9'
+    # a phrase never matches across a line break
+    assert clean('a\nb 3', ['a\nb']) == 'a\nb 3'
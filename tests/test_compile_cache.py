@@ -0,0 +1,38 @@
+import multiprocessing
+import pytest
+from app.compile_cache import CompileCache, CacheEntry
+from app.execution import ExecutionSession
+
+
+CODE = '#include <stdio.h>\nint main() { printf("hi\\n"); return 0; }'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompileCache(str(tmp_path))
+
+
+def test_entry_evicted_before_the_link_is_recompiled(cache, tmp_path, monkeypatch):
+    # The lookup saw the entry, another worker evicted its executable before the link
+    monkeypatch.setattr(cache, 'lookup', lambda key: CacheEntry(0, '', str(tmp_path / 'gone.bin')))
+    with ExecutionSession(CODE, cache=cache) as session:
+        assert session.compile()
+        assert not session.compiler_missing
+        assert not session.cache_hit
+        assert session.run('') == ('hi', None)
+
+
+def store_some_runs(cache_dir, worker):
+    cache = CompileCache(cache_dir)
+    for i in range(40):
+        cache.store_runs('ab' * 32, {f'{worker}-{i}': ('out', None)})
+
+
+def test_concurrent_run_stores_keep_every_result(cache):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=store_some_runs, args=(cache.cache_dir, w)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(cache.lookup_runs('ab' * 32)) == 160
@@ -0,0 +1,65 @@
+import time
+import pytest
+from app import execution
+from app.execution import ExecutionSession, SubmissionBudget, BUDGET_EXCEEDED_ERROR
+from app.sandbox import SandboxBusy
+
+
+class FakePool:
+    """Sandbox pool whose runner is held by other submissions for `busy_for` seconds."""
+
+    def __init__(self, busy_for=0.0, program_seconds=0.0):
+        self.busy_for = busy_for
+        self.program_seconds = program_seconds
+
+    def run(self, argv, stdin_data, timeout, wait=None, started=None):
+        if wait is not None and self.busy_for > wait:
+            time.sleep(wait)
+            raise SandboxBusy('no runner')
+        time.sleep(self.busy_for)
+        if started is not None:
+            timeout = started()
+        time.sleep(min(self.program_seconds, timeout))
+        timed_out = self.program_seconds > timeout
+        return {'stdout': '' if timed_out else stdin_data, 'stderr': '', 'returncode': 0,
+                'timed_out': timed_out, 'elapsed': min(self.program_seconds, timeout)}
+
+
+@pytest.fixture
+def session(tmp_path):
+    from app.compile_cache import CompileCache
+    with ExecutionSession('int main() { return 0; }', cache=CompileCache(str(tmp_path))) as session:
+        assert session.compile()
+        yield session
+
+
+def test_budget_is_charged_only_while_a_program_runs():
+    budget = SubmissionBudget(1.0)
+    time.sleep(0.2)
+    assert budget.remaining() == pytest.approx(1.0)
+    budget.start_run()
+    budget.start_run()
+    time.sleep(0.2)
+    budget.end_run()
+    budget.end_run()
+    assert budget.remaining() == pytest.approx(0.8, abs=0.05)
+
+
+def test_waiting_for_a_runner_is_not_charged(session, monkeypatch):
+    monkeypatch.setattr(execution, 'sandbox_pool', FakePool(busy_for=0.3, program_seconds=0.1))
+    assert session.run_all(['1', '2'], max_workers=1, budget=0.5) == [('1', None), ('2', None)]
+
+
+def test_own_runs_use_up_the_budget(session, monkeypatch):
+    monkeypatch.setattr(execution, 'sandbox_pool', FakePool(program_seconds=0.3))
+    results = session.run_all(['1', '2', '3'], max_workers=1, budget=0.5)
+    assert results[0] == ('1', None)
+    assert results[1] == (None, 'Execution timed out')
+    assert results[2] == (None, BUDGET_EXCEEDED_ERROR)
+
+
+def test_no_free_runner_is_not_a_failed_test(session, monkeypatch):
+    monkeypatch.setattr(execution, 'sandbox_pool', FakePool(busy_for=10))
+    with pytest.raises(SandboxBusy):
+        session.run_all(['1', '2'], max_workers=2, budget=0.2)
+    assert not session.reproducible
@@ -0,0 +1,149 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import grading, grading_queue as queue_module
+from app.grading_queue import GradingQueue, QUEUED, RUNNING, DONE, FAILED, SUPERSEDED, UNKNOWN
+from app.schema import SchemaCheck, missing_columns
+
+
+SUBMISSION = {
+    'id': 7, 'correctness_score': None, 'syntax_score': None, 'logic_score': None,
+    'submitted_at': datetime.now(), 'grading_error': None,
+    'correctness_weight': 50, 'syntax_weight': 25, 'logic_weight': 25,
+}
+SCORES = {'correctness_score': 100, 'syntax_score': 80, 'logic_score': 60, 'feedback': 'ok'}
+
+
+@pytest.fixture
+def queue(monkeypatch, db):
+    queue = GradingQueue()
+    monkeypatch.setattr(queue_module, 'grading_queue', queue)
+    # The database has been migrated: submissions.grading_error exists
+    db.on('information_schema.COLUMNS', lambda args: [{'COLUMN_NAME': 'grading_error'}]
+          if 'grading_error' in args else [])
+    monkeypatch.setattr(queue_module, 'grading_error_column', SchemaCheck(
+        'test', lambda cur: not missing_columns(cur, 'submissions', ['grading_error'])))
+    return queue
+
+
+def updates(db):
+    return [(query, args) for query, args in db.queries if 'UPDATE submissions' in query]
+
+
+def status_of(client):
+    response = client.get('/student/submission/7/status')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_status_reports_a_job_in_progress(student_client, db, queue):
+    db.on('FROM submissions s', [SUBMISSION])
+    queue._set_status(7, RUNNING, 1, new=True)
+    assert status_of(student_client) == {'submission_id': 7, 'status': RUNNING}
+
+
+def test_status_falls_back_to_the_stored_scores(student_client, db, queue):
+    db.on('FROM submissions s', [dict(SUBMISSION, correctness_score=100, syntax_score=80, logic_score=60)])
+    assert status_of(student_client) == {
+        'submission_id': 7, 'status': DONE, 'correctness_score': 100,
+        'syntax_score': 80, 'logic_score': 60, 'total_score': 85,
+    }
+
+
+def test_status_of_another_students_submission_is_not_found(student_client, db, queue):
+    response = student_client.get('/student/submission/7/status')
+    assert response.status_code == 404
+
+
+def test_stale_job_ends_superseded(app, student_client, db, queue, monkeypatch):
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: dict(SCORES))
+    db.on('SELECT code FROM submissions', [{'code': 'int main() { return 1; }'}])
+    db.on('FROM submissions s', [SUBMISSION])
+    queue._set_status(7, QUEUED, 1, new=True)
+    queue._grade(app, 7, 1, 3, 5, 'int main() { return 0; }')
+
+    assert status_of(student_client) == {'submission_id': 7, 'status': SUPERSEDED}
+    assert not any('UPDATE submissions' in query for query, args in db.queries)
+
+
+def test_older_job_does_not_overwrite_the_newer_one(app, db, queue, monkeypatch):
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: dict(SCORES))
+    db.on('SELECT code FROM submissions', [{'code': 'new'}])
+    queue._set_status(7, QUEUED, 1, new=True)
+    # The student resubmits before the first job runs
+    queue._set_status(7, QUEUED, 2, new=True)
+    queue._grade(app, 7, 1, 3, 5, 'old')
+    assert queue.status(7)['status'] == QUEUED
+
+    queue._grade(app, 7, 2, 3, 5, 'new')
+    assert queue.status(7)['status'] == DONE
+
+
+def test_busy_sandbox_is_retried(app, db, queue, monkeypatch):
+    results = [{'error': 'busy', 'retryable': True}, dict(SCORES)]
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: results.pop(0))
+    monkeypatch.setattr(queue_module, 'RETRY_DELAY', 0)
+    db.on('SELECT code FROM submissions', [{'code': 'code'}])
+    queue.submit(app, 7, 3, 5, 'code')
+
+    deadline = time.monotonic() + 5
+    while queue.status(7)['status'] != DONE and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.status(7) == {'status': DONE, 'activity_id': 3, 'attempt': 1}
+    assert any('UPDATE submissions' in query for query, args in db.queries)
+
+
+def test_busy_sandbox_fails_after_the_retries(app, db, queue, monkeypatch):
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: {'error': 'busy', 'retryable': True})
+    monkeypatch.setattr(queue_module, 'RETRY_ATTEMPTS', 0)
+    queue._set_status(7, QUEUED, 1, new=True)
+    queue._grade(app, 7, 1, 3, 5, 'code')
+    assert queue.status(7) == {'status': queue_module.FAILED, 'error': 'busy'}
+
+
+def test_status_reports_a_failure_recorded_by_another_worker(student_client, db, queue):
+    db.on('FROM submissions s', [dict(SUBMISSION, grading_error='gcc crashed')])
+    assert status_of(student_client) == {'submission_id': 7, 'status': FAILED, 'error': 'gcc crashed'}
+
+
+def test_status_of_a_lost_job_ends_unknown(student_client, db, queue):
+    db.on('FROM submissions s', [dict(SUBMISSION, submitted_at=datetime.now() - timedelta(hours=1))])
+    status = status_of(student_client)
+    assert status['status'] == UNKNOWN and status['error']
+
+
+def test_failed_job_is_recorded_in_the_database(app, db, queue, monkeypatch):
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: {'error': 'Activity not found'})
+    queue._set_status(7, QUEUED, 1, new=True)
+    queue._grade(app, 7, 1, 3, 5, 'code')
+
+    assert queue.status(7)['status'] == FAILED
+    [(query, args)] = updates(db)
+    assert 'grading_error' in query and 'code=%s' in query
+    assert args == ('Activity not found', 7, 'code')
+
+
+def submit(client, db, existing_scores):
+    db.on('FROM users WHERE username', [{'id': 5}])
+    db.on('JOIN enrollments', [{'id': 3}])
+    db.on('FOR UPDATE', [{'id': 7}] if existing_scores else [])
+    return client.post('/student/submit_activity/3', data={'code': 'int main() { return 0; }'},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+
+
+def test_sync_grading_failure_keeps_the_previous_scores(student_client, db, queue, monkeypatch):
+    monkeypatch.setattr(queue_module, 'ASYNC_GRADING', False)
+    monkeypatch.setattr(grading, 'grade_submission', lambda *args: {'error': 'Activity not found'})
+    response = submit(student_client, db, existing_scores=True)
+
+    assert 'grading failed' in response.get_json()['message']
+    assert not any('correctness_score=NULL' in query for query, args in updates(db))
+
+
+def test_async_resubmission_clears_the_previous_error(student_client, db, queue, monkeypatch):
+    monkeypatch.setattr(queue, 'submit', lambda *args: None)
+    response = submit(student_client, db, existing_scores=True)
+
+    assert response.status_code == 202
+    [(query, args)] = updates(db)
+    assert 'correctness_score=NULL' in query and 'grading_error=NULL' in query
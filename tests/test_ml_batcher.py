@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from app import ml_batcher as batching
+from app.ml_batcher import InferenceBatcher
+
+
+def fake_predict(calls):
+    def predict(models, feature_vectors, backend=None):
+        calls.append(len(feature_vectors))
+        return np.array([[float(sum(row))] * 3 for row in feature_vectors])
+    return predict
+
+
+def test_concurrent_rows_share_a_batch(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batching, 'predict', fake_predict(calls))
+    batcher = InferenceBatcher(max_wait_ms=50)
+    assert list(batcher.predict({}, [1, 2], backend='forest')) == [3.0] * 3
+    assert calls == [1]
+
+
+def test_a_stuck_batch_thread_falls_back_to_a_direct_prediction(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batching, 'predict', fake_predict(calls))
+    batcher = InferenceBatcher(result_timeout=0.05)
+    # The batch thread never starts
+    monkeypatch.setattr(batcher, '_start', lambda: None)
+
+    start = time.monotonic()
+    assert list(batcher.predict({}, [4, 5], backend='forest')) == [9.0] * 3
+    assert time.monotonic() - start < 1
+    assert batcher.stats()['timeouts'] == 1
+
+    # The abandoned row is dropped once the thread runs
+    monkeypatch.undo()
+    monkeypatch.setattr(batching, 'predict', fake_predict(calls))
+    batcher._start()
+    assert list(batcher.predict({}, [1, 1], backend='forest')) == [2.0] * 3
+    # Counted after the result is handed back
+    deadline = time.monotonic() + 1
+    while batcher.stats()['rows'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batcher.stats()['rows'] == 1
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from app import ml_models
+from app.ml_models import ml_model_store
+from app.code_features import FEATURE_NAMES
+from app.grading import code_grader
+from app.grading_pipeline import grading_pipeline
+
+
+CONTEXT = {'correctness_w': 50.0, 'syntax_w': 30.0, 'logic_w': 20.0, 'due_date': None, 'requirements': []}
+
+# A distilled linear student that predicts correctness 80, logic 60 and syntax 90 for any code
+STUDENT_MODELS = {'distilled': {'kind': 'linear', 'weights': np.zeros((len(FEATURE_NAMES), 3)),
+                                'bias': np.array([80.0, 60.0, 90.0])}}
+
+
+def scores(**values):
+    run = grading_pipeline.start(grader=code_grader, context=CONTEXT, code='int main(void) { return 0; }',
+                                 submitted_at=None, session=None)
+    # Rule-based stage values: all tests pass, logic 40, syntax 100
+    run._values.update({'syntax': (100, ''), 'syntax_ok': True, 'tests': (100, [], 'Tests'),
+                        'logic': 40, 'structure_feedback': '', 'overdue_penalty': 0}, **values)
+    return run.get('scores'), run.evaluated()
+
+
+@pytest.fixture
+def models(monkeypatch):
+    monkeypatch.setattr(ml_models, 'BACKEND', 'distilled')
+    monkeypatch.setattr(ml_model_store, 'get', lambda: STUDENT_MODELS)
+
+
+def test_models_are_not_used_by_default(models):
+    result, evaluated = scores()
+    assert (result['correctness'], result['logic'], result['syntax']) == (100, 40, 100)
+    assert 'ml_scores' not in evaluated
+
+
+def test_blend_mixes_the_prediction_into_each_score(models, monkeypatch):
+    monkeypatch.setattr(ml_models, 'BLEND', 0.5)
+    result, evaluated = scores()
+    assert (result['correctness'], result['logic'], result['syntax']) == (90, 50, 95)
+    assert result['total'] == pytest.approx(90 * 0.5 + 95 * 0.3 + 50 * 0.2)
+    assert 'ml_scores' in evaluated
+
+
+def test_blend_without_models_keeps_rule_based_scores(monkeypatch):
+    monkeypatch.setattr(ml_models, 'BLEND', 0.5)
+    monkeypatch.setattr(ml_model_store, 'get', lambda: None)
+    result, _ = scores()
+    assert (result['correctness'], result['logic'], result['syntax']) == (100, 40, 100)
+
+
+def test_syntax_errors_are_not_blended(models, monkeypatch):
+    monkeypatch.setattr(ml_models, 'BLEND', 0.5)
+    result, evaluated = scores(syntax=(40, 'error'), syntax_ok=False)
+    assert (result['correctness'], result['logic'], result['syntax']) == (0, 0, 0)
+    assert 'ml_scores' not in evaluated
@@ -0,0 +1,34 @@
+import shutil
+import pytest
+from app.pch import PrecompiledHeaders
+from app.execution import COMPILE_FLAGS, run_gcc
+from app.workspace import workspace_manager
+
+pytestmark = pytest.mark.skipif(shutil.which('gcc') is None, reason='gcc is not installed')
+
+CODES = [
+    # A note points into a header the prelude included
+    '#include <stdio.h>\nint printf = 3;\nint main(void) { return 0; }\n',
+    # Another include order than the prelude's, after a comment and a blank line
+    '// sums\n#include <stdlib.h>\n\n#include <stdio.h>\n'
+    'int main(void) { printf("%d\\n", abs("a")); return 0; }\n',
+]
+
+
+def diagnostics(code, include_flags):
+    with workspace_manager.acquire() as workspace:
+        source = workspace.file('student_code.c')
+        with open(source, 'w') as f:
+            f.write(code)
+        return run_gcc(include_flags + COMPILE_FLAGS + ['-fsyntax-only', source], workspace, 30).stderr
+
+
+@pytest.mark.parametrize('code', CODES)
+def test_prelude_does_not_change_the_diagnostics(code, tmp_path):
+    pch = PrecompiledHeaders(pch_dir=str(tmp_path), preludes=[('stdio.h',), ('stdio.h', 'stdlib.h')])
+    include_flags = pch.include_flags(code, COMPILE_FLAGS)
+    assert include_flags, 'no prelude matched'
+
+    with_prelude = diagnostics(code, include_flags)
+    assert str(tmp_path) not in with_prelude
+    assert with_prelude == diagnostics(code, [])
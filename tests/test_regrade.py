@@ -0,0 +1,32 @@
+from app.grading import code_grader
+from app.grading_results import grading_results
+from app.regrade import RegradeManager
+
+
+class Session:
+    def timings(self):
+        return {'compile': 0, 'runs': []}
+
+    def close(self):
+        pass
+
+
+def test_a_grading_error_keeps_the_stored_grade(db, monkeypatch):
+    db.on('FROM submissions WHERE activity_id', [
+        {'id': 1, 'code': 'int main(void) { return 0; }', 'submitted_at': None},
+    ])
+    monkeypatch.setattr(code_grader, 'load_grading_context', lambda activity_id: {'plan_version': None})
+    monkeypatch.setattr(code_grader, 'open_execution_session', lambda code, reuse_runs=False: Session())
+
+    def fail(*args):
+        raise RuntimeError('grader bug')
+    monkeypatch.setattr(code_grader, 'grade_code', fail)
+    monkeypatch.setattr(grading_results, 'load_activity', lambda activity_id, plan_version: {})
+
+    manager = RegradeManager(max_workers=1)
+    manager._jobs[3] = manager._new_job(3)
+    manager._regrade(3)
+
+    assert not any('UPDATE submissions' in query for query, _ in db.queries)
+    status = manager.status(3)
+    assert (status['graded'], status['failed'], status['written']) == (1, 1, 0)
@@ -0,0 +1,30 @@
+import pytest
+from app import sandbox
+from app.sandbox import run_program
+
+
+LIMITS = {'output_kb': 1}
+
+
+@pytest.fixture(params=[True, False], ids=['streaming', 'buffered'])
+def pipes(request, monkeypatch):
+    """Run with the streaming reader, and with the buffered one used where pipes cannot be polled."""
+    monkeypatch.setattr(sandbox, 'PIPES_POLLABLE', request.param)
+    return request.param
+
+
+def test_echoes_stdin(pipes):
+    result = run_program(['/bin/sh', '-c', 'read x; echo "got $x"'], 'abc\n', 10, LIMITS)
+    assert (result['returncode'], result['stdout'], result['timed_out']) == (0, 'got abc\n', False)
+
+
+def test_output_is_capped(pipes):
+    result = run_program(['/bin/sh', '-c', 'yes x | head -c 5000'], '', 10, LIMITS)
+    assert result['output_limit_exceeded']
+    assert len(result['stdout']) == 1024
+
+
+def test_timeout(pipes):
+    result = run_program(['/bin/sh', '-c', 'sleep 5'], '', 0.5, LIMITS)
+    assert result['timed_out']
+    assert result['elapsed'] < 4
@@ -0,0 +1,55 @@
+from app import schema
+from app.schema import SchemaCheck
+from tests.conftest import FakeDB
+
+
+def columns(*names):
+    return lambda args: [{'COLUMN_NAME': name} for name in names if name in args[1:]]
+
+
+def test_migrate_applies_only_the_missing_changes():
+    db = FakeDB()
+    db.on('information_schema.COLUMNS', columns('grading_plan', 'grading_plan_version', 'grading_error'))
+    db.on('information_schema.TABLES', [])
+    applied = schema.migrate(db.cursor())
+
+    assert applied == ['added submissions.grading_timings', 'created grading_results']
+    ddl = [query for query, args in db.queries if 'ALTER' in query or 'CREATE' in query]
+    assert len(ddl) == 2 and 'ADD COLUMN grading_timings' in ddl[0]
+
+
+def test_check_keeps_a_ready_schema():
+    calls = []
+    check = SchemaCheck('feature', lambda cur: calls.append(cur) or True)
+    assert check.ready('cur') and check.ready('cur')
+    assert len(calls) == 1
+
+
+def test_check_retries_a_missing_schema(monkeypatch):
+    answers = [False, RuntimeError('lock wait timeout'), True]
+
+    def answer(cur):
+        result = answers.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    check = SchemaCheck('feature', answer, recheck_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr(schema.time, 'monotonic', lambda: now[0])
+    assert not check.ready('cur')
+    # Not asked again within the recheck interval
+    assert not check.ready('cur')
+    assert len(answers) == 2
+    now[0] += 61
+    assert not check.ready('cur')
+    now[0] += 61
+    assert check.ready('cur')
+
+
+def test_grading_does_not_change_the_schema(app, db):
+    from app.grading_plan import grading_plans
+    db.on('information_schema.COLUMNS', [])
+    with app.app_context():
+        assert grading_plans.context(1, None) is None
+    assert not any('ALTER' in query or 'CREATE' in query for query, args in db.queries)
@@ -0,0 +1,50 @@
+from datetime import datetime
+import pytest
+from app.regrade import regrade_manager
+from app.grading_plan import grading_plans
+
+
+TEST_CASES_JSON = '[{"input": "1 2", "output": "3"}]'
+DUE_DATE = datetime(2030, 1, 1, 12, 0)
+
+
+def form(correctness=50, syntax=30, logic=20, description='Add two numbers'):
+    return {
+        'title': 'Sum', 'description': description, 'instructions': 'Read two ints',
+        'test_case_input[]': ['1 2'], 'test_case_output[]': ['3'],
+        'due_date': DUE_DATE.strftime('%Y-%m-%dT%H:%M'),
+        'rubric_name[]': ['Correctness', 'Syntax', 'Logic'],
+        'rubric_weight[]': [str(correctness), str(syntax), str(logic)],
+    }
+
+
+@pytest.fixture
+def regrades(db, monkeypatch):
+    db.on('FROM users WHERE username', [{'id': 7}])
+    db.on('FROM activities WHERE id=%s AND teacher_id=%s', [{
+        'description': 'Add two numbers', 'instructions': 'Read two ints', 'due_date': DUE_DATE,
+        'test_cases_json': TEST_CASES_JSON, 'correctness_weight': 50, 'syntax_weight': 30, 'logic_weight': 20,
+    }])
+    monkeypatch.setattr(grading_plans, 'save', lambda cur, activity_id, grader: None)
+    started = []
+    monkeypatch.setattr(regrade_manager, 'start',
+                        lambda app, activity_id: started.append(activity_id) or {'status': 'queued'})
+    return started
+
+
+def test_unchanged_grading_inputs_do_not_regrade(teacher_client, regrades):
+    response = teacher_client.put('/teacher/activity/3', data=form())
+    assert response.status_code == 200
+    assert regrades == []
+
+
+def test_weight_change_regrades(teacher_client, regrades):
+    response = teacher_client.put('/teacher/activity/3', data=form(correctness=60, syntax=20, logic=20))
+    assert response.status_code == 200
+    assert regrades == [3]
+    assert 'regrade' in response.get_json()
+
+
+def test_description_change_regrades(teacher_client, regrades):
+    teacher_client.put('/teacher/activity/3', data=form(description='Add three numbers'))
+    assert regrades == [3]
@@ -2,24 +2,82 @@
 """
 Script to train machine learning models for C code grading.
 Run this script to train ML models using historical grading data.
+
+Every graded submission is used. The models are evaluated with k-fold
+cross-validation, timed, and published to the model registry unless they
+are less accurate or slower than the version being served beyond the
+thresholds (see app/ml_training.py). Exits with status 1 when nothing is
+published.
+
+    python train_ml_models.py [--multi-output] [--n-jobs N] [--folds K] [--distill linear|boosted|none]
+                              [--max-mae-increase 0.05] [--max-latency-increase 0.25]
+                              [--force] [--dry-run]
 """
 
 import sys
 import os
+import argparse
+
+# Add the repository root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app import ml_training
+from app.ml_models import ml_model_store, TARGETS, MULTI_OUTPUT, DISTILL
+
 
-# Add the app directory to the Python path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+def print_report(report):
+    data = report['data']
+    print(f" Training data: {data['rows']} submissions in {data['seconds']}s "
+          f"({data['rows_per_sec']} rows/s, peak RSS {data['peak_rss_mb']}MB)")
 
-from flask import Flask
-from app.grading import train_ml_grading_model
+    evaluation = report.get('evaluation')
+    if not evaluation:
+        return
+    previous = report['current']['evaluation'] or {}
+    previous_mae = previous.get('mae', {})
 
-def create_app():
-    app = Flask(__name__)
+    print(f"\n {'':<24} {'new':>10} {'served':>10}")
+    for target in TARGETS:
+        print(f" {f'MAE {target}':<24} {evaluation['mae'][target]:>10} {previous_mae.get(target, '-'):>10}")
+    for key, label in (('mae_mean', 'MAE mean'), ('predict_ms_per_sample', 'predict ms/sample'),
+                       ('predict_ms_p95', 'predict ms p95'), ('model_mb', 'model MB'),
+                       ('fit_seconds', 'fit s'), ('evaluate_seconds', f"{evaluation['folds']}-fold eval s")):
+        print(f" {label:<24} {evaluation[key]:>10} {previous.get(key, '-'):>10}")
+
+    student = evaluation.get('distilled')
+    if student:
+        previous_student = previous.get('distilled') or {}
+        print(f" distilled student: {student['kind']}")
+        for key, label in (('mae_mean', 'MAE mean'), ('accuracy_loss', 'MAE over forests'),
+                           ('fidelity_mae', 'distance to forests'), ('predict_ms_per_sample', 'predict ms/sample'),
+                           ('predict_ms_p95', 'predict ms p95')):
+            print(f" {label:<24} {student[key]:>10} {previous_student.get(key, '-'):>10}")
+
+    if report['current']['version'] is not None:
+        print(f" (served: version {report['current']['version']})")
 
-    return app
 
 def main():
     """Main function to train ML models."""
+    parser = argparse.ArgumentParser(description="Train the ML models for C code grading.")
+    parser.add_argument('--multi-output', action='store_true', default=MULTI_OUTPUT,
+                        help='train one forest for all three scores instead of one per score')
+    parser.add_argument('--n-jobs', type=int, default=ml_training.N_JOBS,
+                        help='cores used to fit the forests (-1: all)')
+    parser.add_argument('--folds', type=int, default=ml_training.FOLDS, help='cross-validation folds')
+    parser.add_argument('--distill', choices=('linear', 'boosted', 'none'), default=DISTILL,
+                        help='compact student model distilled from the forests (served with GRADING_ML_BACKEND=distilled)')
+    parser.add_argument('--max-mae-increase', type=float, default=ml_training.MAX_MAE_INCREASE,
+                        help='largest relative increase of the mean MAE that still publishes')
+    parser.add_argument('--max-latency-increase', type=float, default=ml_training.MAX_LATENCY_INCREASE,
+                        help='largest relative increase of the predict latency that still publishes')
+    parser.add_argument('--force', action='store_true', help='publish even if the checks fail')
+    parser.add_argument('--dry-run', action='store_true', help='train and evaluate, but do not publish')
+    args = parser.parse_args()
+    if args.folds < 2:
+        parser.error('--folds must be at least 2')
+
     print(" Starting ML Model Training for C Code Grading")
     print("=" * 50)
 
@@ -27,20 +85,32 @@ def main():
 
     with app.app_context():
         print(" Gathering historical grading data...")
-        success = train_ml_grading_model()
+        report = ml_training.train(
+            multi_output=args.multi_output, n_jobs=args.n_jobs, folds=args.folds, distill_kind=args.distill,
+            max_mae_increase=args.max_mae_increase, max_latency_increase=args.max_latency_increase,
+            force=args.force, dry_run=args.dry_run
+        )
+        print_report(report)
 
-        if success:
-            print("ML models trained successfully!")
-            print(" Models saved to: ml_grading_models.pkl")
-            print("\n The grading system will now use ML-enhanced analysis")
-            print("   for more accurate C code evaluation.")
+        if report['published']:
+            print(f"\nML models published as version {report['version']} in {ml_model_store.registry_dir}/")
+            print(" Running workers switch to the new version within")
+            print("   GRADING_ML_CHECK_INTERVAL seconds, without a restart.")
+            if report['refused']:
+                print(f" Published despite: {'; '.join(report['refused'])}")
+        elif args.dry_run and 'evaluation' in report:
+            print("\n Dry run: nothing published.")
+            for reason in report['refused']:
+                print(f" Would be refused: {reason}")
         else:
-            print(" Failed to train ML models.")
-            print(" Make sure you have sufficient historical grading data")
-            print("   (at least 50 submissions with grades).")
+            print("\n ML models not published:")
+            for reason in report['refused']:
+                print(f"   {reason}")
 
     print("\n" + "=" * 50)
     print("Training complete!")
+    return 0 if report['published'] or (args.dry_run and 'evaluation' in report) else 1
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())